@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+import os
+
+basedir = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', '..')
+
+import sys
+sys.path.insert(0, os.path.join(basedir, 'src'))
+from config import Config
+from run import load_store, summarize, export_cutflow, render
+
+# Redraw plots from the histogram store of run.py without reading samples.
+config = Config('config.yaml', {'do-not-merge': True, 'do-not-list': True})
+store = load_store(config['store'])
+summarize(config, store)
+export_cutflow(config, store)
+render(config, store)
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+
+import os
+
+basedir = os.path.join(os.path.dirname(__file__), '..', '..')
+
+import sys
+sys.path.insert(0, os.path.join(basedir, 'src'))
+from batch import run_batch
+
+# Fill all 2018 configs in one pass over their shared samples.
+run_batch([os.path.join(os.path.dirname(__file__), channel, 'mc', part, 'config.yaml')
+           for channel in ['0L', '1L'] for part in ['zss_part', 'zcc_part']])
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+
+# One engine for the wcb analyses of all eras of Run 2, in place of per-era copies of the scripts of ../wcb.
+# Eras and their luminosities are read from a yaml file (see eras.yaml). Each era is read once, in its own
+# worker process, into histograms of every plotted column against HbcVSQCS; cuts are then differences of
+# cumulative sums. Every analysis is rendered for each era under <era>/ and for the sum of all eras under Run2/:
+#
+#   data-mc/  SR scan of data-mc.py, with data/MC ratios and weight and PU weight distributions
+#   sr/       SR scan of sr.py, with the joint threshold optimizer
+#   plot/     distributions and cuts of plot.py and plot-QCS.py, with the significance views of signif*.py
+#   view/     b-jet multiplicity of view.py
+#
+# Usage: engine.py eras.yaml [era ...]
+
+import os
+import re
+import sys
+import yaml
+import pickle
+import builtins
+import concurrent.futures
+import numpy as np
+import uproot
+import mplhep as hep
+import matplotlib.pyplot as plt
+import matplotlib.gridspec as gridspec
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+import expr
+import cache
+from window import scan_windows, get_score_edges, fill_scores, cumulate_scores, select_scores, optimize_thresholds
+
+# Transcript printed content to a log file, opened by the main process only.
+logfile = None
+def print(*args, **kwargs):
+    builtins.print(*args, **kwargs)
+    if logfile: builtins.print(*args, **{**kwargs, 'file': logfile})
+
+plt.style.use(hep.style.CMS)
+gs_signif = gridspec.GridSpec(2, 1, height_ratios=[4, 1])
+gs_data_mc = gridspec.GridSpec(3, 1, height_ratios=[4, 1, 1])
+
+SCORE_NBIN = 1000
+
+# Score ranges of the SRs of sr/ in which every score edge is a candidate of the joint threshold optimizer.
+JOINT_RANGES = [(0.990, 1.000), (0.900, 0.999), (0.500, 0.990)]
+
+# Columns evaluated on PKUTree. Data has no puWeight.
+expressions = {name: re.sub(r'\s+', ' ', expression) for (name, expression) in [
+    ('weight',   '''weight'''),
+    ('puWeight', '''puWeight'''),
+    ('nb',       '''nb_t_deep_ex'''),  # Tight. Exclusive or inclusive?
+    ('sdmass',   '''Mj_V2_a'''),
+    ('HbcVSQCD', '''1.0 / (1.0 + (a_QCDb + a_QCDbb + a_QCDc + a_QCDcc + a_QCDothers) / a_Hbc)'''),
+    ('HbcVSQCS', '''1.0 / (1.0 + (0.997032 * (a_QCDb + a_QCDbb + a_QCDc + a_QCDcc + a_QCDothers) +
+                                  0.002968 * a_Hcs) / a_Hbc)'''),
+]}
+labels = {
+    'Wcb':   r'W + Jets and Top ($W \to cb$)',
+    'QCD':   r'QCD',
+    'WJets': r'W + Jets ($W \to \mathrm{others}$)',
+    'Top':   r'Top',
+    'Rest':  r'Others',
+}
+mcfile_pattern = re.compile(r'^.*Tree_(.*)\.root$')
+thresholds = {
+    'data-mc': [
+        [0.990, 0.995, 0.998, 0.999],
+        [0.800, 0.900, 0.950, 0.980],
+        [0.000, 0.500, 0.800, 0.900],
+    ],
+    'sr': [
+        [0.990, 0.995, 0.998, 0.999],
+        [0.950, 0.980, 0.990, 0.995],
+        [0.800, 0.900, 0.950, 0.980],
+    ],
+    'plot': [0.950, 0.980, 0.990, 0.995, 0.998, 0.999],
+}
+score_edges = get_score_edges(SCORE_NBIN, thresholds=[*thresholds['data-mc'], *thresholds['sr'], thresholds['plot']])
+sdmass_bins = np.linspace(20, 220, 21)       # data-mc/
+sdmass_fine_bins = np.linspace(20, 220, 51)  # sr/ and plot/
+weight_bins = np.logspace(-3, 3, 61)
+nb_bins = np.linspace(0, 8.0, 9)
+
+# Load the era list and settings of a yaml file. Paths are relative to the file.
+def load_settings(filename):
+
+    with open(filename) as file:
+        settings = yaml.safe_load(file)
+    directory = os.path.dirname(os.path.abspath(filename))
+    for era in settings['eras']:
+        era['name'] = str(era['name'])
+        era['sample-dir'] = os.path.join(directory, era.get('sample-dir', os.path.join('samples', era['name'])))
+    settings['workers'] = settings.get('workers', len(settings['eras']))
+    settings['cache-dir'] = settings.get('cache-dir') and os.path.join(directory, settings['cache-dir'])
+    settings['cache-size'] = settings.get('cache-size', '20 GB')
+    settings['maxevent'] = settings.get('maxevent')
+    settings['output-dir'] = directory
+    return settings
+
+# Read branches of the PKUTree of files one after another, stopping after maxevent events.
+def read_trees(files, branches, maxevent=None):
+
+    for file in files:
+        if maxevent is not None and maxevent <= 0: return
+        with uproot.open(file) as root_file:
+            for chunk in root_file['PKUTree'].iterate(branches, entry_stop=maxevent, step_size='100 MB', library='np'):
+                if maxevent is not None: maxevent -= len(chunk[branches[0]])
+                yield chunk
+
+# Evaluate a compiled plan on files through the column cache. Return columns by name. Only complete reads are
+# cached; a cached sample is cut to maxevent events without reading the rest.
+def read_columns(files, plan, names, settings):
+
+    maxevent = settings['maxevent']
+    column_cache = settings['cache-dir'] and cache.ColumnCache(settings['cache-dir'], settings['cache-size'])
+    columns = column_cache and column_cache.load(files, plan.unique_expressions)
+    if columns is None:
+        chunks = (plan.evaluate(chunk) for chunk in read_trees(files, plan.branches, maxevent))
+        if column_cache and maxevent is None: chunks = column_cache.store(files, plan.unique_expressions, chunks)
+        chunks = list(chunks)
+        columns = [np.concatenate([chunk[i] for chunk in chunks] or [np.empty(0)]) for i in range(len(plan.unique))]
+    return {name: column[:maxevent] for (name, column) in zip(names, plan.fan_out(columns))}
+
+# Histogram columns of events against their scores. Events with an undefined score fall in no score bin, so
+# that no cut selects them, as in the scripts of ../wcb. Histograms of the b-vetoed events serve data-mc/ and
+# sr/, the others plot/ and view/.
+def fill(columns):
+
+    weight = columns['weight']
+    score = {name: columns[name] for name in ['HbcVSQCD', 'HbcVSQCS']}
+    hists = {'nb': np.histogram(columns['nb'], nb_bins, weights=weight)[0]}
+    for name in ['HbcVSQCD', 'HbcVSQCS']:
+        hists[name] = np.histogram(score[name], score_edges, weights=weight)[0]
+        hists[name + '-nevent'] = np.histogram(score[name], score_edges)[0].astype('float64')
+        hists[name + '-sdmass'] = fill_scores(score[name], columns['sdmass'], sdmass_fine_bins, score_edges, weight)
+    veto = columns['nb'] == 0
+    score = score['HbcVSQCS'][veto]
+    sdmass, weight = columns['sdmass'][veto], weight[veto]
+    hists['veto-nevent'] = np.histogram(score, score_edges)[0].astype('float64')
+    hists['veto-sdmass'] = fill_scores(score, sdmass, sdmass_bins, score_edges, weight)
+    hists['veto-sdmass-fine'] = fill_scores(score, sdmass, sdmass_fine_bins, score_edges, weight)
+    hists['veto-weight'] = fill_scores(score, weight, weight_bins, score_edges)
+    if 'puWeight' in columns:
+        hists['veto-puWeight'] = fill_scores(score, columns['puWeight'][veto], weight_bins, score_edges)
+    return hists
+
+# Fill the histograms of one era. Plans are compiled once by the caller and shared by all eras.
+def process_era(era, settings, mc_plan, data_plan):
+
+    sampledir = era['sample-dir']
+    mcfiles = sorted(os.path.join(sampledir, 'mc', name) for name in os.listdir(os.path.join(sampledir, 'mc')) if name.endswith('.root'))
+    hists = {}
+    for mcfile in mcfiles:
+        match = mcfile_pattern.search(mcfile)
+        if not match: continue
+        category = 'Wcb' if match.group(1) == 'Signal' else match.group(1)
+        if category not in labels: continue
+        builtins.print('%s: loading %s events...' % (era['name'], category), flush=True)
+        hists[category] = fill(read_columns([mcfile], mc_plan, list(expressions), settings))
+    datadir = os.path.join(sampledir, 'data')
+    datafiles = sorted(os.path.join(datadir, name) for name in os.listdir(datadir) if re.match(r'^SlimmedTree_.*\.root$', name)) \
+        if os.path.isdir(datadir) else []
+    if datafiles:
+        builtins.print('%s: loading data...' % era['name'], flush=True)
+        columns = read_columns(datafiles, data_plan, [name for name in expressions if name != 'puWeight'], settings)
+        blinded = (columns['sdmass'] < 50) | (columns['sdmass'] > 110)
+        hists['data'] = fill({name: column[blinded] for (name, column) in columns.items()})
+    return hists
+
+# Sum histograms of several eras category by category.
+def combine(results):
+
+    combined = {}
+    for hists in results:
+        for category, hist in hists.items():
+            if category not in combined:
+                combined[category] = {key: value.copy() for (key, value) in hist.items()}
+            else:
+                for key, value in hist.items(): combined[category][key] += value
+    return combined
+
+def label(year, lumi):
+    try:
+        hep.cms.label(data=False, paper=False, supplementary=False, year=year, lumi=lumi)
+    except Exception:
+        hep.cms.label(data=False, label='Preliminary', year=year, lumi=lumi)
+
+def figure(year, lumi, gs=None, *args, **kwargs):
+    fig = plt.figure(*args, **kwargs)
+    if gs is not None: fig.add_subplot(gs[0])
+    label(year, lumi)
+    return fig
+
+def histplot(hists, cates):
+    data_hist = None
+    hs, cs = [], []
+    for hist, cate in zip(hists, cates):
+        if cate == 'data': data_hist = hist; continue
+        hs.append(hist); cs.append(cate)
+    hists, cates = hs, cs
+    counts     = [hist[0] for (hist, cate) in zip(hists, cates) if cate != 'Wcb']
+    bins       = [hist[1] for (hist, cate) in zip(hists, cates) if cate != 'Wcb']
+    wcb_hists  = [hist    for (hist, cate) in zip(hists, cates) if cate == 'Wcb']
+    wcb_cates  = ['Wcb'] if wcb_hists else []
+    cates      = [cate for cate in cates if cate != 'Wcb']
+    cate_ids   = [{'QCD': 0, 'Top': -1, 'WJets': -2, 'Rest': -3}.get(cate, -99) for cate in cates]
+    items      = sorted(zip(cate_ids, cates, counts, bins), key=lambda item: item[:2])
+    cates      = [item[1]            for item in items]
+    hists      = [(item[2], item[3]) for item in items]
+    hep.histplot(hists,                stack=True,  histtype='fill',     label=[labels[cate] for cate in cates    ], edgecolor='black', linewidth=0.5)
+    plt.errorbar(np.mean([bins[0][:-1], bins[0][1:]], axis=0), np.sum(counts, axis=0), yerr=np.sqrt(np.sum(counts, axis=0)), linestyle='', color='black')
+    if wcb_hists: hep.histplot(wcb_hists, yerr=True, stack=False, histtype='step', label=[labels[cate] for cate in wcb_cates], color='black')
+    if not data_hist: return
+    hep.histplot(data_hist, yerr=True, stack=False, histtype='errorbar', label='data', color='black')
+
+def savefig(path, *args, **kwargs):
+    print('Saving to %s...' % path)
+    plt.savefig(path, *args, **kwargs)
+
+# Scan lower and upper mass windows, skipping those with less background than min_background.
+def signif(hists, cates, min_background=None):
+    bins = hists[0][1]
+    s_counts = np.sum([hist[0] for (hist, cate) in zip(hists, cates) if cate == 'Wcb'] + [np.zeros(len(bins) - 1)], axis=0)
+    b_counts = np.sum([hist[0] for (hist, cate) in zip(hists, cates) if cate not in ['Wcb', 'data']] + [np.zeros(len(bins) - 1)], axis=0)
+    signif_l, signif_u = scan_windows(s_counts, b_counts, min_background)
+    l = signif_l.argmax()
+    u = signif_u.argmax()
+    signif_max = signif_l[l]
+    plt.plot(bins, signif_l, label='lower')
+    plt.plot(bins, signif_u, label='upper')
+    plt.plot([bins[l]] * 2, [0, signif_max * 1.2], 'k--')
+    plt.plot([bins[u]] * 2, [0, signif_max * 1.2], 'k--')
+    plt.plot([], [], 'k--', label='optimal (%.3f)' % signif_max)
+    plt.legend()
+    return signif_max
+
+def data_over_mc(hists, cates):
+    if 'data' not in cates: return
+    bins = hists[0][1]
+    d = hists[list(cates).index('data')][0]
+    m = np.sum([hist[0] for (hist, cate) in zip(hists, cates) if cate != 'data'] + [np.zeros(len(d))], axis=0)
+    dom = d / (m + (d == 0))
+    err_dom = dom * np.hypot(1 / np.sqrt(d + (d == 0)), 1 / np.sqrt(m + (m == 0)))
+    x = np.mean([bins[:-1], bins[1:]], axis=0)
+    plt.ylim(-0.2, 1.8)
+    plt.errorbar(x, dom, yerr=err_dom, fmt='ko')
+
+# Histograms of events with lb <= score < ub from cumulative score histograms, as (counts, bins) per category.
+def select(cumsums, bins, lb=-np.inf, ub=np.inf):
+
+    return [(select_scores(cumsum, score_edges, lb, ub), bins) for cumsum in cumsums.values()]
+
+# Rebin a cumulative score histogram to bins on the score grid, each edge taken as the nearest score edge to
+# absorb rounding. Scores never exceed 1, so a last bin ending at 1 includes scores of exactly 1, as np.histogram
+# does.
+def rebin_scores(cumsum, bins):
+
+    bounds = score_edges[np.abs(score_edges[:, np.newaxis] - bins[np.newaxis, :]).argmin(axis=0)]
+    if bins[-1] == 1.0: bounds[-1] = np.inf
+    return np.diff([select_scores(cumsum, score_edges, -np.inf, bound) for bound in bounds])
+
+# Print unweighted event counts of categories with lb <= HbcVSQCS < ub.
+def print_counts(nevent_cumsums, lb=-np.inf, ub=np.inf):
+
+    for category, cumsum in nevent_cumsums.items():
+        print('  - %s:\t%d' % (category, select_scores(cumsum, score_edges, lb, ub)))
+
+# Draw soft-drop mass histograms with a significance subplot, and a data/MC subplot if data is drawn.
+def plot_sdmass(year, lumi, hists, categories, path):
+
+    gs = gs_data_mc if 'data' in categories else gs_signif
+    fig = figure(year, lumi, gs, figsize=(12, 13.5 if 'data' in categories else 11.25), dpi=150)
+    histplot(hists, categories)
+    plt.ylabel('Events'); plt.yscale('log'); plt.legend(); plt.grid()
+    plt.gca().set_xticklabels([]); fig.add_subplot(gs[1])
+    s = signif(hists, categories)
+    plt.ylabel('Significance'); plt.grid()
+    if 'data' in categories:
+        plt.gca().set_xticklabels([]); fig.add_subplot(gs[2])
+        data_over_mc(hists, categories)
+        plt.ylabel('Data/MC')
+    plt.xlabel('Soft Dropped Mass [GeV]'); plt.grid()
+    plt.tight_layout(); savefig(path)
+    plt.close()
+    return s
+
+# Draw unweighted distributions of a weight column.
+def plot_weights(year, lumi, hists, categories, xlabel, path):
+
+    figure(year, lumi, figsize=(12, 9), dpi=150)
+    histplot(hists, categories)
+    plt.xlabel(xlabel); plt.ylabel('Unweighted events'); plt.xscale('log'); plt.yscale('log'); plt.legend(); plt.grid()
+    plt.tight_layout(); savefig(path)
+    plt.close()
+
+# Choose SR thresholds one SR after another, each below the ones chosen before, keeping the threshold of
+# the highest significance. Extra plots of each threshold are drawn by plot_extra(threshold, score_ub).
+def scan_srs(year, lumi, cumsums, nevent_cumsums, sr_thresholds, directory, plot_extra=None):
+
+    score_ub = np.inf
+    for iSR in range(len(sr_thresholds)):
+        s_best = -1.0
+        for threshold in sr_thresholds[iSR]:
+            print('Cut HbcVSQCS >= %.3f:' % threshold)
+            print_counts(nevent_cumsums, threshold, score_ub)
+            s = plot_sdmass(year, lumi, select(cumsums, cumsums.bins, threshold, score_ub), list(cumsums),
+                            os.path.join(directory, 'sr%d-%.3f.pdf' % (iSR + 1, threshold)))
+            if plot_extra: plot_extra(iSR, threshold, score_ub)
+            if s > s_best: s_best = s; threshold_best = threshold
+        score_ub = min(score_ub, threshold_best)
+        print('Cut HbcVSQCS < %.3f:' % score_ub)
+        print_counts(nevent_cumsums, -np.inf, score_ub)
+
+# Choose SR thresholds jointly, maximizing the quadratic sum of their significances, and draw the SRs.
+def optimize_srs(year, lumi, name, cumsums, candidates, directory, windows=None):
+
+    s_cumsum = np.sum([cumsum for (category, cumsum) in cumsums.items() if category == 'Wcb'] + [np.zeros_like(next(iter(cumsums.values())))], axis=0)
+    b_cumsum = np.sum([cumsum for (category, cumsum) in cumsums.items() if category not in ['Wcb', 'data']] + [np.zeros_like(s_cumsum)], axis=0)
+    joint = optimize_thresholds(s_cumsum, b_cumsum, score_edges, candidates, windows=windows)
+    signif_joint, thresholds_joint, signifs_joint, windows_joint = joint
+    print('Optimal %s SR thresholds (significance %.3f):' % (name, signif_joint))
+    score_ub = np.inf
+    for iSR, (threshold, s, window) in enumerate(zip(thresholds_joint, signifs_joint, windows_joint)):
+        print('  - SR%d:\tHbcVSQCS >= %.4f, %.0f <= sdmass < %.0f GeV, significance %.3f' % (
+            iSR + 1, threshold, cumsums.bins[window[0]], cumsums.bins[window[1]], s))
+        plot_sdmass(year, lumi, select(cumsums, cumsums.bins, threshold, score_ub), list(cumsums),
+                    os.path.join(directory, 'sr%d-%s.pdf' % (iSR + 1, name)))
+        score_ub = threshold
+    return joint
+
+class Cumsums(dict):
+
+    # Cumulative score histograms by category, binned in bins along their other axis.
+    def __init__(self, hists, key, bins, categories=None):
+
+        dict.__init__(self, {category: cumulate_scores(hist[key]) for (category, hist) in hists.items()
+                             if key in hist and (categories is None or category in categories)})
+        self.bins = bins
+
+# SR scan of data-mc.py.
+def render_data_mc(year, lumi, hists, directory):
+
+    print('data-mc:')
+    cumsums = Cumsums(hists, 'veto-sdmass', sdmass_bins)
+    nevent_cumsums = Cumsums(hists, 'veto-nevent', None)
+    weight_cumsums = Cumsums(hists, 'veto-weight', weight_bins)
+    puweight_cumsums = Cumsums(hists, 'veto-puWeight', weight_bins)
+    print('B veto:')
+    print_counts(nevent_cumsums)
+    plot_sdmass(year, lumi, select(cumsums, sdmass_bins), list(cumsums), os.path.join(directory, 'all.pdf'))
+    def plot_extra(iSR, threshold, score_ub):
+        plot_weights(year, lumi, select(weight_cumsums, weight_bins, threshold, score_ub), list(weight_cumsums),
+                     'Weight', os.path.join(directory, 'sr%d-%.3f_weight.pdf' % (iSR + 1, threshold)))
+        plot_weights(year, lumi, select(puweight_cumsums, weight_bins, threshold, score_ub), list(puweight_cumsums),
+                     'PU Weight', os.path.join(directory, 'sr%d-%.3f_puweight.pdf' % (iSR + 1, threshold)))
+    scan_srs(year, lumi, cumsums, nevent_cumsums, thresholds['data-mc'], directory, plot_extra)
+    optimize_srs(year, lumi, 'joint', cumsums, thresholds['data-mc'], directory)
+
+# SR scan of sr.py on simulation: greedy, then joint over all tuples of the candidates, then joint over every
+# score edge in JOINT_RANGES within the mass windows found before.
+def render_sr(year, lumi, hists, directory):
+
+    print('sr:')
+    mc = [category for category in hists if category != 'data']
+    cumsums = Cumsums(hists, 'veto-sdmass-fine', sdmass_fine_bins, mc)
+    nevent_cumsums = Cumsums(hists, 'veto-nevent', None, mc)
+    print('B veto:')
+    print_counts(nevent_cumsums)
+    scan_srs(year, lumi, cumsums, nevent_cumsums, thresholds['sr'], directory)
+    joint = optimize_srs(year, lumi, 'joint', cumsums, thresholds['sr'], directory)
+    candidates = [score_edges[(score_edges >= lb) & (score_edges < ub)] for (lb, ub) in JOINT_RANGES]
+    print('Joint scan over %s candidates:' % ' x '.join(str(len(c)) for c in candidates))
+    optimize_srs(year, lumi, 'joint-scan', cumsums, candidates, directory, windows=joint[3])
+
+# Distributions and successive cuts of plot.py and plot-QCS.py on simulation, without b veto, with the
+# significance views of signif.py and signif-QCS.py. Histograms are saved as plot.pkl and plot-QCS.pkl.
+def render_plot(year, lumi, hists, directory):
+
+    print('plot:')
+    mc = [category for category in hists if category != 'data']
+    for score, prefix in [('HbcVSQCD', 'plot'), ('HbcVSQCS', 'plot-QCS')]:
+        cumsums = Cumsums(hists, score + '-sdmass', sdmass_fine_bins, mc)
+        score_cumsums = Cumsums(hists, score, None, mc)
+        nevent_cumsums = Cumsums(hists, score + '-nevent', None, mc)
+        plot = {'labels': {category: labels[category] for category in cumsums}}
+        plot['sdmass'] = select(cumsums, sdmass_fine_bins)
+        for name, bins in [(score, np.linspace(0.0, 1.0, 51)), (score + '-0.95', np.linspace(0.95, 1.0, 51))]:
+            plot[name] = [(rebin_scores(cumsum, bins), bins) for cumsum in score_cumsums.values()]
+        for threshold in sorted(thresholds['plot']):
+            print('Cut %s >= %.3f:' % (score, threshold))
+            print_counts(nevent_cumsums, threshold)
+            plot['sdmass-%.3f' % threshold] = select(cumsums, sdmass_fine_bins, threshold)
+        for name, hist in plot.items():
+            if name == 'labels': continue
+            figure(year, lumi, figsize=(12, 9), dpi=150)
+            histplot(hist, list(cumsums))
+            plt.xlabel('Soft Dropped Mass [GeV]' if name.startswith('sdmass') else score); plt.ylabel('Events'); plt.yscale('log')
+            plt.legend(); plt.grid(); plt.tight_layout(); savefig(os.path.join(directory, '%s-%s.pdf' % (prefix, name)))
+            plt.close()
+            if name.startswith('sdmass'):
+                plot_sdmass(year, lumi, hist, list(cumsums), os.path.join(directory, '%s-%s-sig.pdf' % (prefix, name)))
+        with open(os.path.join(directory, prefix + '.pkl'), 'wb') as file:
+            pickle.dump(plot, file)
+
+# b-jet multiplicity of view.py on simulation.
+def render_view(year, lumi, hists, directory):
+
+    print('view:')
+    categories = [category for category in hists if category != 'data']
+    figure(year, lumi, figsize=(12, 9), dpi=150)
+    histplot([(hists[category]['nb'], nb_bins) for category in categories], categories)
+    plt.xlabel('$N_b$'); plt.ylabel('Events'); plt.yscale('log')
+    plt.legend(); plt.grid(); plt.tight_layout(); savefig(os.path.join(directory, 'view-nb.pdf'))
+    plt.close()
+
+# Draw and save every analysis of one era, or of several eras combined, under a directory named after it.
+def render(name, year, lumi, hists, directory):
+
+    print('%s (%.2f/fb):' % (name, lumi))
+    directory = os.path.join(directory, name)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'hists.pkl'), 'wb') as file:
+        pickle.dump({'eras': name, 'lumi': lumi, 'score-edges': score_edges, 'hists': hists}, file)
+    for analysis, render_analysis in [('data-mc', render_data_mc), ('sr', render_sr), ('plot', render_plot), ('view', render_view)]:
+        os.makedirs(os.path.join(directory, analysis), exist_ok=True)
+        render_analysis(year, lumi, hists, os.path.join(directory, analysis))
+
+# Fill the selected eras concurrently, one worker per era, then render each era and their sum.
+def run(settings, names=None):
+
+    eras = [era for era in settings['eras'] if not names or era['name'] in names]
+    mc_plan = expr.Plan(list(expressions.values()))
+    data_plan = expr.Plan([expression for (name, expression) in expressions.items() if name != 'puWeight'])
+    print('Expression plan: %s' % mc_plan)
+    with concurrent.futures.ProcessPoolExecutor(max(1, min(settings['workers'], len(eras)))) as executor:
+        futures = [executor.submit(process_era, era, settings, mc_plan, data_plan) for era in eras]
+        results = [future.result() for future in futures]
+    for era, hists in zip(eras, results):
+        render(era['name'], era['name'], era['lumi'], hists, settings['output-dir'])
+    if len(eras) > 1:
+        render('Run2', 'Run 2', sum(era['lumi'] for era in eras), combine(results), settings['output-dir'])
+
+if __name__ == '__main__':
+
+    settings = load_settings(sys.argv[1])
+    logfile = open(os.path.join(settings['output-dir'], 'engine.log'), 'w')
+    run(settings, sys.argv[2:])
@@ -9,6 +9,11 @@ import awkward as ak
 import mplhep as hep
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from window import scan_windows, get_score_edges, fill_scores, cumulate_scores, select_scores
+from selection import Selection
 
 # Transcript printed content to a same-name log file.
 logfile = open(re.sub(r'\.py$', '.log', __file__), 'w')
@@ -20,6 +25,10 @@ gs = gridspec.GridSpec(3, 1, height_ratios=[4, 1, 1])
 NEVENT_MAX = None
 #NEVENT_MAX = 1000000
 
+# Derive HbcVSQCS cuts from one histogram of each plotted column against SCORE_NBIN score bins per category.
+SCAN = True
+SCORE_NBIN = 1000
+
 event_expressions = list(map(lambda x: (x[0], re.sub(r'\s+', ' ', x[1])), [
     ('isWcb',  '''isWcb'''),
     ('weight', '''weight'''),
@@ -83,8 +92,9 @@ def concatenate(files, expressions, n=None):
         ) / aliased_events['%s_probHbc' % jet_label])
     return aliased_events
 
-# Categorized events.
-events = { 'Wcb': [] }
+# Events read from each MC file, and the category of each.
+mc_events = []
+mc_categories = []
 
 for mcfile in mcfiles:
     # Extract category from pathname.
@@ -94,11 +104,18 @@ for mcfile in mcfiles:
     if category == 'Wcb': raise RuntimeError('unexpected category: Wcb')
     if category not in labels: continue
 
-    # Split Wcb and non-Wcb events.
     print('Loading %s events...' % category)
-    current_events = concatenate([mcfile + ':PKUTree'], expressions, NEVENT_MAX)
-    wcb_events    = current_events[current_events['isWcb'] == True ]
-    nonwcb_events = current_events[current_events['isWcb'] == False]
+    mc_events.append(concatenate([mcfile + ':PKUTree'], expressions, NEVENT_MAX))
+    mc_categories.append((category, mcfile))
+
+# Categorized events, selected lazily by index from the events read.
+events = { 'Wcb': [] }
+all_events = Selection(mc_events)
+
+for i, (category, mcfile) in enumerate(mc_categories):
+    # Split Wcb and non-Wcb events.
+    current_events = all_events.part(i)
+    wcb_events, nonwcb_events = current_events.split(current_events['isWcb'] == True)
     print('%d events (%d Wcb) loaded from %s.' % (len(current_events), len(wcb_events), mcfile))
     events['Wcb'].append(wcb_events)
     events[category] = nonwcb_events
@@ -107,16 +124,13 @@ for mcfile in mcfiles:
 if not events['Wcb']:
     del events['Wcb']
 else:
-    events['Wcb'] = ak.concatenate(events['Wcb'])
+    events['Wcb'] = Selection.union(events['Wcb'])
 
 # Load data.
 print('Loading data...')
-events['data'] = concatenate([datafile + ':PKUTree' for datafile in datafiles], expressions, NEVENT_MAX)
+events['data'] = Selection(concatenate([datafile + ':PKUTree' for datafile in datafiles], expressions, NEVENT_MAX))
 print('Blinding data...')
-events['data'] = ak.concatenate([
-    events['data'][events['data']['a_sdmass'] <  50],
-    events['data'][events['data']['a_sdmass'] > 110],
-])
+events['data'] = events['data'].cut((events['data']['a_sdmass'] < 50) | (events['data']['a_sdmass'] > 110))
 
 categories = list(events.keys())
 
@@ -155,10 +169,8 @@ def savefig(path, *args, **kwargs):
     print('Saving to %s...' % path)
     plt.savefig(path, *args, **kwargs)
 
-def get_signif(s, b):
-    return np.sqrt(2 * ((s + b) * np.log(1 + s / (b + (s == 0))) - s))
-
-def signif(hists, cates):
+# Scan lower and upper mass windows, skipping those with less background than min_background.
+def signif(hists, cates, min_background=None):
     hs, cs = [], []
     for hist, cate in zip(hists, cates):
         if cate == 'data': continue
@@ -170,16 +182,8 @@ def signif(hists, cates):
     for hist in wcb_hists + hists:
         if np.any(hist[1] != bins): raise NotImplementedError('rebinning not implemented')
         if hist[0].shape[0] + 1 != hist[1].shape[0]: raise ValueError('incompatible bin count size')
-    s_cumsum = np.sum([np.cumsum(np.concatenate([[0], count])) for (count, _) in wcb_hists], axis=0)
-    b_cumsum = np.sum([np.cumsum(np.concatenate([[0], count])) for (count, _) in hists    ], axis=0)
-    signif = np.zeros((len(bins), len(bins)))
-    for imin in range(len(bins) - 1):
-        for imax in range(imin + 1, len(bins)):
-            s = s_cumsum[imax] - s_cumsum[imin]
-            b = b_cumsum[imax] - b_cumsum[imin]
-            signif[imin, imax] = get_signif(s, b)
-    signif_l = signif.max(axis=1)
-    signif_u = signif.max(axis=0)
+    signif_l, signif_u = scan_windows(np.sum([count for (count, _) in wcb_hists], axis=0),
+                                      np.sum([count for (count, _) in hists    ], axis=0), min_background)
     l = signif_l.argmax()
     u = signif_u.argmax()
     signif_max = signif_l[l]
@@ -210,13 +214,13 @@ def data_over_mc(hists, cates):
 print('B veto:')
 cut_events = { }
 for category in categories:
-    cut_events[category] = events[category][events[category]['nb'] == 0]
+    cut_events[category] = events[category].cut(events[category]['nb'] == 0)
     print('  - %s:\t%d' % (category, len(cut_events[category])))
 events = cut_events
 
 fig = figure(figsize=(12, 13.5), dpi=150)
 sdmass_bins = np.linspace(20, 220, 21)
-sdmass_hists = [np.histogram(events[category]['a_sdmass'].to_numpy(), sdmass_bins, weights=events[category]['weight'].to_numpy()) for category in categories]
+sdmass_hists = [np.histogram(events[category]['a_sdmass'], sdmass_bins, weights=events[category]['weight']) for category in categories]
 histplot(sdmass_hists, categories)
 plt.ylabel('Events'); plt.yscale('log'); plt.legend(); plt.grid()
 plt.gca().set_xticklabels([]); fig.add_subplot(gs[1])
@@ -234,20 +238,38 @@ thresholds = [
     [0.800, 0.900, 0.950, 0.980],
 ]
 
+# Cuts in scan mode are differences of cumulative sums along the score axis, below the SR thresholds chosen so far.
+weight_bins = np.logspace(-3, 3, 61)
+if SCAN:
+    score_edges = get_score_edges(SCORE_NBIN, thresholds=thresholds)
+    def scan(category, column, bins, weighted):
+        return cumulate_scores(fill_scores(events[category]['a_HbcVSQCS'], events[category][column], bins, score_edges,
+                                           events[category]['weight'] if weighted else None))
+    def select(cumsums, bins, threshold):
+        return [(select_scores(cumsum, score_edges, threshold, score_ub), bins) for cumsum in cumsums.values()]
+    nevent_cumsums = { category: cumulate_scores(np.histogram(events[category]['a_HbcVSQCS'], score_edges)[0]) for category in categories }
+    sdmass_cumsums = { category: scan(category, 'a_sdmass', sdmass_bins, True) for category in categories }
+    weight_cumsums = { category: scan(category, 'weight', weight_bins, False) for category in categories }
+    score_ub = np.inf
+
 for iSR in range(len(thresholds)):
 
     s_best = -1.0
     for threshold in thresholds[iSR]:
 
         print('Cut HbcVSQCS >= %.3f:' % threshold)
-        cut_events = { }
-        for category in categories:
-            cut_events[category] = events[category][events[category]['a_HbcVSQCS'] >= threshold]
-            print('  - %s:\t%d' % (category, len(cut_events[category])))
+        if SCAN:
+            for category in categories:
+                print('  - %s:\t%d' % (category, select_scores(nevent_cumsums[category], score_edges, threshold, score_ub)))
+            sdmass_hists = select(sdmass_cumsums, sdmass_bins, threshold)
+        else:
+            cut_events = { }
+            for category in categories:
+                cut_events[category] = events[category].cut(events[category]['a_HbcVSQCS'] >= threshold)
+                print('  - %s:\t%d' % (category, len(cut_events[category])))
+            sdmass_hists = [np.histogram(cut_events[category]['a_sdmass'], sdmass_bins, weights=cut_events[category]['weight']) for category in categories]
 
         fig = figure(figsize=(12, 13.5), dpi=150)
-        sdmass_bins = np.linspace(20, 220, 21)
-        sdmass_hists = [np.histogram(cut_events[category]['a_sdmass'].to_numpy(), sdmass_bins, weights=cut_events[category]['weight'].to_numpy()) for category in categories]
         histplot(sdmass_hists, categories)
         plt.ylabel('Events'); plt.yscale('log'); plt.legend(); plt.grid()
         plt.gca().set_xticklabels([]); fig.add_subplot(gs[1])
@@ -262,8 +284,10 @@ for iSR in range(len(thresholds)):
         fig = plt.figure(figsize=(12, 9), dpi=150)
         try: hep.cms.label(data=False, paper=False, supplementary=False, year=2018, lumi=59.83)
         except Exception: hep.cms.label(data=False, label='Preliminary', year=2018, lumi=59.83)
-        weight_bins = np.logspace(-3, 3, 61)
-        weight_hists = [np.histogram(cut_events[category]['weight'].to_numpy(), weight_bins) for category in categories]
+        if SCAN:
+            weight_hists = select(weight_cumsums, weight_bins, threshold)
+        else:
+            weight_hists = [np.histogram(cut_events[category]['weight'], weight_bins) for category in categories]
         histplot(weight_hists, categories)
         plt.xlabel('Weight'); plt.ylabel('Unweighted events'); plt.xscale('log'); plt.yscale('log'); plt.legend(); plt.grid()
         plt.tight_layout(); savefig('sr%d-%.3f_weight.pdf' % (iSR + 1, threshold))
@@ -273,8 +297,13 @@ for iSR in range(len(thresholds)):
 
     threshold = threshold_best
     print('Cut HbcVSQCS < %.3f:' % threshold)
+    if SCAN:
+        score_ub = min(score_ub, threshold)
+        for category in categories:
+            print('  - %s:\t%d' % (category, select_scores(nevent_cumsums[category], score_edges, -np.inf, score_ub)))
+        continue
     cut_events = { }
     for category in categories:
-        cut_events[category] = events[category][events[category]['a_HbcVSQCS'] < threshold]
+        cut_events[category] = events[category].cut(events[category]['a_HbcVSQCS'] < threshold)
         print('  - %s:\t%d' % (category, len(cut_events[category])))
     events = cut_events
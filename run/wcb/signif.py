@@ -6,6 +6,10 @@ import numpy as np
 import mplhep as hep
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from window import scan_windows
 import pickle
 
 logfile = open(re.sub(r'\.py$', '.log', __file__), 'w')
@@ -43,26 +47,16 @@ def savefig(path, *args, **kwargs):
 plot = pickle.load(open('plot.pkl', 'rb'))
 labels = plot['labels']
 
-def get_signif(s, b):
-    return np.sqrt(2 * ((s + b) * np.log(1 + s / (b + (s == 0))) - s))
-
-def signif(hists, cates):
+# Scan lower and upper mass windows, skipping those with less background than min_background.
+def signif(hists, cates, min_background=None):
     wcb_hists  = [hist    for (hist, cate) in zip(hists, cates) if cate == 'Wcb']
     hists      = [hist    for (hist, cate) in zip(hists, cates) if cate != 'Wcb']
     bins = wcb_hists[0][1]
     for hist in wcb_hists + hists:
         if np.any(hist[1] != bins): raise NotImplementedError('rebinning not implemented')
         if hist[0].shape[0] + 1 != hist[1].shape[0]: raise ValueError('incompatible bin count size')
-    s_cumsum = np.sum([np.cumsum(np.concatenate([[0], count])) for (count, _) in wcb_hists], axis=0)
-    b_cumsum = np.sum([np.cumsum(np.concatenate([[0], count])) for (count, _) in hists    ], axis=0)
-    signif = np.zeros((len(bins), len(bins)))
-    for imin in range(len(bins) - 1):
-        for imax in range(imin + 1, len(bins)):
-            s = s_cumsum[imax] - s_cumsum[imin]
-            b = b_cumsum[imax] - b_cumsum[imin]
-            signif[imin, imax] = get_signif(s, b)
-    signif_l = signif.max(axis=1)
-    signif_u = signif.max(axis=0)
+    signif_l, signif_u = scan_windows(np.sum([count for (count, _) in wcb_hists], axis=0),
+                                      np.sum([count for (count, _) in hists    ], axis=0), min_background)
     l = signif_l.argmax()
     u = signif_u.argmax()
     signif_max = signif_l[l]
@@ -9,6 +9,11 @@ import awkward as ak
 import mplhep as hep
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from window import scan_windows, get_score_edges, fill_scores, cumulate_scores, select_scores, optimize_thresholds
+from selection import Selection
 
 # Transcript printed content to a same-name log file.
 logfile = open(re.sub(r'\.py$', '.log', __file__), 'w')
@@ -20,6 +25,13 @@ gs = gridspec.GridSpec(2, 1, height_ratios=[4, 1])
 NEVENT_MAX = None
 #NEVENT_MAX = 1000000
 
+# Derive HbcVSQCS cuts from one histogram of soft-drop mass against SCORE_NBIN score bins per category.
+SCAN = True
+SCORE_NBIN = 1000
+
+# Score ranges of the SRs in which every score edge is a candidate of the joint threshold optimizer.
+JOINT_RANGES = [(0.990, 1.000), (0.900, 0.999), (0.500, 0.990)]
+
 event_expressions = list(map(lambda x: (x[0], re.sub(r'\s+', ' ', x[1])), [
     ('isWcb',  '''isWcb'''),
     ('weight', '''weight'''),
@@ -82,8 +94,9 @@ def concatenate(files, expressions, n=None):
         ) / aliased_events['%s_probHbc' % jet_label])
     return aliased_events
 
-# Categorized events.
-events = { 'Wcb': [] }
+# Events read from each ROOT file, and the category of each.
+mc_events = []
+mc_categories = []
 
 for rootfile in rootfiles:
     # Extract category from pathname.
@@ -93,17 +106,24 @@ for rootfile in rootfiles:
     if category == 'Wcb': raise RuntimeError('unexpected category: Wcb')
     if category not in labels: continue
 
-    # Split Wcb and non-Wcb events.
     print('Loading %s events...' % category)
-    current_events = concatenate([rootfile + ':PKUTree'], expressions, NEVENT_MAX)
-    wcb_events    = current_events[current_events['isWcb'] == True ]
-    nonwcb_events = current_events[current_events['isWcb'] == False]
+    mc_events.append(concatenate([rootfile + ':PKUTree'], expressions, NEVENT_MAX))
+    mc_categories.append((category, rootfile))
+
+# Categorized events, selected lazily by index from the events read.
+events = { 'Wcb': [] }
+all_events = Selection(mc_events)
+
+for i, (category, rootfile) in enumerate(mc_categories):
+    # Split Wcb and non-Wcb events.
+    current_events = all_events.part(i)
+    wcb_events, nonwcb_events = current_events.split(current_events['isWcb'] == True)
     print('%d events (%d Wcb) loaded from %s.' % (len(current_events), len(wcb_events), rootfile))
     events['Wcb'].append(wcb_events)
     events[category] = nonwcb_events
 
 # Merge Wcb events from different categories.
-events['Wcb'] = ak.concatenate(events['Wcb'])
+events['Wcb'] = Selection.union(events['Wcb'])
 categories = list(events.keys())
 
 def figure(*args, **kwargs):
@@ -132,26 +152,16 @@ def savefig(path, *args, **kwargs):
     print('Saving to %s...' % path)
     plt.savefig(path, *args, **kwargs)
 
-def get_signif(s, b):
-    return np.sqrt(2 * ((s + b) * np.log(1 + s / (b + (s == 0))) - s))
-
-def signif(hists, cates):
+# Scan lower and upper mass windows, skipping those with less background than min_background.
+def signif(hists, cates, min_background=None):
     wcb_hists  = [hist    for (hist, cate) in zip(hists, cates) if cate == 'Wcb']
     hists      = [hist    for (hist, cate) in zip(hists, cates) if cate != 'Wcb']
     bins = wcb_hists[0][1]
     for hist in wcb_hists + hists:
         if np.any(hist[1] != bins): raise NotImplementedError('rebinning not implemented')
         if hist[0].shape[0] + 1 != hist[1].shape[0]: raise ValueError('incompatible bin count size')
-    s_cumsum = np.sum([np.cumsum(np.concatenate([[0], count])) for (count, _) in wcb_hists], axis=0)
-    b_cumsum = np.sum([np.cumsum(np.concatenate([[0], count])) for (count, _) in hists    ], axis=0)
-    signif = np.zeros((len(bins), len(bins)))
-    for imin in range(len(bins) - 1):
-        for imax in range(imin + 1, len(bins)):
-            s = s_cumsum[imax] - s_cumsum[imin]
-            b = b_cumsum[imax] - b_cumsum[imin]
-            signif[imin, imax] = get_signif(s, b)
-    signif_l = signif.max(axis=1)
-    signif_u = signif.max(axis=0)
+    signif_l, signif_u = scan_windows(np.sum([count for (count, _) in wcb_hists], axis=0),
+                                      np.sum([count for (count, _) in hists    ], axis=0), min_background)
     l = signif_l.argmax()
     u = signif_u.argmax()
     signif_max = signif_l[l]
@@ -166,7 +176,7 @@ def signif(hists, cates):
 print('B veto:')
 cut_events = { }
 for category in categories:
-    cut_events[category] = events[category][events[category]['nb'] == 0]
+    cut_events[category] = events[category].cut(events[category]['nb'] == 0)
     print('  - %s:\t%d' % (category, len(cut_events[category])))
 events = cut_events
 
@@ -176,20 +186,32 @@ thresholds = [
     [0.800, 0.900, 0.950, 0.980],
 ]
 
+# Cuts in scan mode are differences of cumulative sums along the score axis, below the SR thresholds chosen so far.
+sdmass_bins = np.linspace(20, 220, 51)
+if SCAN:
+    score_edges = get_score_edges(SCORE_NBIN, thresholds=thresholds)
+    sdmass_cumsums = { category: cumulate_scores(fill_scores(events[category]['a_HbcVSQCS'], events[category]['a_sdmass'], sdmass_bins, score_edges, events[category]['weight'])) for category in categories }
+    nevent_cumsums = { category: cumulate_scores(np.histogram(events[category]['a_HbcVSQCS'], score_edges)[0]) for category in categories }
+    score_ub = np.inf
+
 for iSR in range(len(thresholds)):
 
     s_best = -1.0
     for threshold in thresholds[iSR]:
 
         print('Cut HbcVSQCS >= %.3f:' % threshold)
-        cut_events = { }
-        for category in categories:
-            cut_events[category] = events[category][events[category]['a_HbcVSQCS'] >= threshold]
-            print('  - %s:\t%d' % (category, len(cut_events[category])))
+        if SCAN:
+            for category in categories:
+                print('  - %s:\t%d' % (category, select_scores(nevent_cumsums[category], score_edges, threshold, score_ub)))
+            sdmass_hists = [(select_scores(sdmass_cumsums[category], score_edges, threshold, score_ub), sdmass_bins) for category in categories]
+        else:
+            cut_events = { }
+            for category in categories:
+                cut_events[category] = events[category].cut(events[category]['a_HbcVSQCS'] >= threshold)
+                print('  - %s:\t%d' % (category, len(cut_events[category])))
+            sdmass_hists = [np.histogram(cut_events[category]['a_sdmass'], sdmass_bins, weights=cut_events[category]['weight']) for category in categories]
 
         fig = figure(figsize=(12, 11.25), dpi=150)
-        sdmass_bins = np.linspace(20, 220, 51)
-        sdmass_hists = [np.histogram(cut_events[category]['a_sdmass'], sdmass_bins, weights=cut_events[category]['weight']) for category in categories]
         histplot(sdmass_hists, categories)
         plt.ylabel('Events'); plt.yscale('log'); plt.legend(); plt.grid()
         plt.gca().set_xticklabels([]); fig.add_subplot(gs[1])
@@ -202,8 +224,39 @@ for iSR in range(len(thresholds)):
 
     threshold = threshold_best
     print('Cut HbcVSQCS < %.3f:' % threshold)
+    if SCAN:
+        score_ub = min(score_ub, threshold)
+        for category in categories:
+            print('  - %s:\t%d' % (category, select_scores(nevent_cumsums[category], score_edges, -np.inf, score_ub)))
+        continue
     cut_events = { }
     for category in categories:
-        cut_events[category] = events[category][events[category]['a_HbcVSQCS'] < threshold]
+        cut_events[category] = events[category].cut(events[category]['a_HbcVSQCS'] < threshold)
         print('  - %s:\t%d' % (category, len(cut_events[category])))
     events = cut_events
+
+# Choose the SR thresholds jointly in scan mode, maximizing the quadratic sum of their significances: first over all
+# tuples of the candidates, then over every score edge in JOINT_RANGES within the mass windows found first.
+if SCAN:
+    s_cumsum = np.sum([sdmass_cumsums[category] for category in categories if category == 'Wcb'], axis=0)
+    b_cumsum = np.sum([sdmass_cumsums[category] for category in categories if category != 'Wcb'], axis=0)
+    joint = optimize_thresholds(s_cumsum, b_cumsum, score_edges, thresholds)
+    candidates = [score_edges[(score_edges >= lb) & (score_edges < ub)] for (lb, ub) in JOINT_RANGES]
+    print('Joint scan over %s candidates:' % ' x '.join(str(len(c)) for c in candidates))
+    joint_scan = optimize_thresholds(s_cumsum, b_cumsum, score_edges, candidates, windows=joint[3])
+    for name, (signif_joint, thresholds_joint, signifs_joint, windows_joint) in [('joint', joint), ('joint-scan', joint_scan)]:
+        print('Optimal %s SR thresholds (significance %.3f):' % (name, signif_joint))
+        score_ub = np.inf
+        for iSR, (threshold, s, window) in enumerate(zip(thresholds_joint, signifs_joint, windows_joint)):
+            print('  - SR%d:\tHbcVSQCS >= %.4f, %.0f <= sdmass < %.0f GeV, significance %.3f' % (
+                iSR + 1, threshold, sdmass_bins[window[0]], sdmass_bins[window[1]], s))
+            fig = figure(figsize=(12, 11.25), dpi=150)
+            sdmass_hists = [(select_scores(sdmass_cumsums[category], score_edges, threshold, score_ub), sdmass_bins) for category in categories]
+            histplot(sdmass_hists, categories)
+            plt.ylabel('Events'); plt.yscale('log'); plt.legend(); plt.grid()
+            plt.gca().set_xticklabels([]); fig.add_subplot(gs[1])
+            signif(sdmass_hists, categories)
+            plt.xlabel('Soft Dropped Mass [GeV]'); plt.ylabel('Significance'); plt.grid()
+            plt.tight_layout(); savefig('sr%d-%s.pdf' % (iSR + 1, name))
+            plt.close()
+            score_ub = threshold
@@ -0,0 +1,56 @@
+import os
+import sys
+import run
+from config import Config
+
+# What determines how a sample is read. Configs with equal keys share one read of the sample.
+def get_read_key(sample):
+
+    return (sample['name'], sample.get('merged-index') or sample.get('merged-file') or tuple(sample['files']),
+            sample['maxevent'], sample['preview'], sample['step-size'])
+
+# Fill several configs reading each sample they share once, then save and render each config
+# in the directory of its yaml file.
+def run_batch(filenames):
+
+    configs = [Config(filename) for filename in filenames]
+
+    # Group samples of all configs by how they are read.
+    groups = {}
+    for i, config in enumerate(configs):
+        if not config['hists']: continue
+        samples = [sample for category in config['categories'] for sample in category['samples']]
+        for j, sample in enumerate(samples):
+            groups.setdefault(get_read_key(sample), []).append((i, j, sample))
+    groups = list(groups.values())
+    print('Batch: %d configs, %d sample reads instead of %d' % (len(configs), len(groups), sum(map(len, groups))))
+
+    # Fill all groups with the most generous worker settings of the configs.
+    settings = {
+        'workers': max([config['workers'] for config in configs] + [1]),
+        'merge-workers': max([config['merge-workers'] for config in configs] + [1]),
+        'catalog': configs[0]['catalog'] if configs else None,
+    }
+    results = [{} for config in configs]
+    targets = [[(configs[i], sample) for (i, _, sample) in group] for group in groups]
+    for group, group_results in zip(groups, run.fill_groups(settings, targets)):
+        for (i, j, _), result in zip(group, group_results):
+            results[i][j] = result
+
+    # Reduce, save and render each config on its own.
+    cwd = os.getcwd()
+    for filename, config, config_results in zip(filenames, configs, results):
+        if not config['hists']: continue
+        os.chdir(os.path.dirname(os.path.abspath(filename)))
+        try:
+            store = run.fill_store(config, iter([config_results[j] for j in range(len(config_results))]))
+            run.save_store(store, config['store'])
+            run.summarize(config, store)
+            run.export_cutflow(config, store)
+            run.render(config, store)
+        finally:
+            os.chdir(cwd)
+
+if __name__ == '__main__':
+
+    run_batch(sys.argv[1:])
@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+FINGERPRINT_SIZE = 65536  # Bytes hashed at each end of an input file.
+
+# Parse a size like 1000000, '100 MB' or '1.5 GiB' into bytes.
+def parse_size(size):
+
+    if size is None or isinstance(size, (int, float)): return size
+    match = re.fullmatch(r'\s*([0-9.eE+-]+)\s*([kMGT]?)(i?)B?\s*', size)
+    if not match: raise ValueError('invalid size: %s' % size)
+    base = 1024 if match.group(3) else 1000
+    return int(float(match.group(1)) * base**' kMGT'.index(match.group(2) or ' '))
+
+# Normalize an expression so that spacing does not change its cache key.
+def normalize_expression(expression):
+
+    expression = re.sub(r'\s+', ' ', expression).strip()
+    return re.sub(r' ?([^\w. ]) ?', r'\1', expression)
+
+# Identify an input file by its path, size, mtime and a hash of its head and tail.
+def get_file_identity(path):
+
+    try:
+        stat = os.stat(path)
+        digest = hashlib.sha1()
+        with open(path, 'rb') as file:
+            digest.update(file.read(FINGERPRINT_SIZE))
+            file.seek(max(0, stat.st_size - FINGERPRINT_SIZE))
+            digest.update(file.read(FINGERPRINT_SIZE))
+        return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    except OSError:
+        return [os.path.abspath(path), None, None, None]
+
+# Compute total size of regular files under a directory.
+def get_directory_size(path):
+
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+class ColumnCache:
+
+    # Cache evaluated columns under a directory holding at most maxsize bytes.
+    def __init__(self, directory, maxsize):
+
+        self.directory = directory
+        self.maxsize = parse_size(maxsize)
+
+    # Each (file list, expression list) pair owns one entry. The file identity is checked on load.
+    def get_path(self, files, expressions):
+
+        key = json.dumps([[os.path.abspath(file) for file in files], [normalize_expression(e) for e in expressions]])
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    # Load cached columns as read-only memory maps. Return None on a miss and drop stale entries.
+    def load(self, files, expressions):
+
+        path = self.get_path(files, expressions)
+        try:
+            with open(os.path.join(path, 'meta.json')) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if meta['identity'] != [get_file_identity(file) for file in files]:
+            print('Invalidating stale cache:', path)
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        os.utime(os.path.join(path, 'meta.json'))  # Mark as recently used.
+        return [np.memmap(os.path.join(path, '%d.bin' % i), dtype=dtype, mode='r', shape=(meta['length'],))
+                if meta['length'] else np.empty(0, dtype=dtype) for (i, dtype) in enumerate(meta['dtypes'])]
+
+    # Pass chunks of columns through while appending them to a new entry. The entry is
+    # published atomically once all chunks are consumed, then the cache is trimmed.
+    def store(self, files, expressions, chunks):
+
+        path = self.get_path(files, expressions)
+        identity = [get_file_identity(file) for file in files]
+        os.makedirs(self.directory, exist_ok=True)
+        tmppath = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        outputs, dtypes, length = None, None, 0
+        try:
+            for chunk in chunks:
+                if outputs is None:
+                    dtypes = [column.dtype.str for column in chunk]
+                    outputs = [open(os.path.join(tmppath, '%d.bin' % i), 'wb') for i in range(len(chunk))]
+                if dtypes is not None and all(column.dtype.str == dtype for (column, dtype) in zip(chunk, dtypes)) \
+                        and not any(column.dtype.hasobject for column in chunk):
+                    for column, output in zip(chunk, outputs):
+                        np.ascontiguousarray(column).tofile(output)
+                    length += len(chunk[0])
+                else:
+                    dtypes = None  # Jagged or inconsistent columns are not cached.
+                yield chunk
+            for output in outputs or []: output.close()
+            if outputs is None or dtypes is None: return
+            with open(os.path.join(tmppath, 'meta.json'), 'w') as file:
+                json.dump({'identity': identity, 'dtypes': dtypes, 'length': length}, file)
+            shutil.rmtree(path, ignore_errors=True)
+            try:
+                os.rename(tmppath, path)
+            except OSError:
+                return  # Published concurrently by another process.
+            self.evict(path)
+        finally:
+            for output in outputs or []: output.close()
+            shutil.rmtree(tmppath, ignore_errors=True)
+
+    # Remove least recently used entries until the cache fits its size cap.
+    def evict(self, keep=None):
+
+        if self.maxsize is None: return
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.stat(os.path.join(path, 'meta.json')).st_mtime, get_directory_size(path), path))
+            except OSError:
+                continue
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.maxsize: break
+            if path == keep: continue
+            print('Evicting cache:', path)
+            shutil.rmtree(path, ignore_errors=True)
+            size -= entry_size
+
+# Split columns into chunks of at most step_size entries, or bytes when given as a string.
+def iterate_columns(columns, step_size=None):
+
+    length = len(columns[0]) if columns else 0
+    if isinstance(step_size, str):
+        step_size = max(1, parse_size(step_size) // max(1, sum(column.itemsize for column in columns)))
+    step_size = step_size or max(1, length)
+    for begin in range(0, length, step_size):
+        yield [column[begin:begin + step_size] for column in columns]
@@ -0,0 +1,130 @@
+import os
+import re
+import json
+import sqlite3
+import concurrent.futures
+
+basedir = os.path.join(os.path.dirname(__file__), '..')
+default_path = os.path.join(basedir, '.cache', 'catalog.sqlite')
+SCAN_WORKERS = 16  # Files opened concurrently when scanning metadata.
+
+# Pieces are named <name>_<id>_tree.root.
+re_piece = re.compile(r'^(.*)_([0-9]+)_tree\.root$')
+
+# Read the entry count of the Events tree and the names of all trees in a piece.
+def read_piece_metadata(path):
+
+    import uproot
+    try:
+        with uproot.open(path) as file:
+            trees = sorted(file.keys(filter_classname='TTree', cycle=False))
+            return (file['Events'].num_entries if 'Events' in trees else 0), trees
+    except Exception:
+        return None, []
+
+# Read metadata of many files in a thread pool, which hides the latency of network filesystems.
+def read_pieces_metadata(paths):
+
+    if len(paths) <= 1: return [read_piece_metadata(path) for path in paths]
+    with concurrent.futures.ThreadPoolExecutor(SCAN_WORKERS) as executor:
+        return list(executor.map(read_piece_metadata, paths))
+
+class Catalog:
+
+    # Open the catalog database shared by all configurations.
+    def __init__(self, path=default_path):
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=600)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, mtime INTEGER);
+            CREATE TABLE IF NOT EXISTS pieces (directory TEXT, filename TEXT, name TEXT, id INTEGER,
+                                               size INTEGER, mtime INTEGER, nentry INTEGER, trees TEXT,
+                                               PRIMARY KEY (directory, filename));
+            CREATE INDEX IF NOT EXISTS pieces_by_name ON pieces (directory, name, id);
+        ''')
+
+    # Bring records of a directory up to date. The directory is listed only when its mtime changed,
+    # and only new or modified pieces are opened.
+    def refresh(self, directory):
+
+        path = os.path.abspath(directory)
+        mtime = os.stat(path).st_mtime_ns
+        row = self.connection.execute('SELECT mtime FROM directories WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[0] == mtime: return
+        known = {filename: (size, mtime) for (filename, size, mtime) in self.connection.execute(
+            'SELECT filename, size, mtime FROM pieces WHERE directory = ? AND id IS NOT NULL', (path,))}
+        seen, updates = set(), []
+        for filename in os.listdir(path):
+            match = re_piece.match(filename)
+            if not match: continue
+            try:
+                stat = os.stat(os.path.join(path, filename))
+            except OSError:
+                continue
+            seen.add(filename)
+            if known.get(filename) == (stat.st_size, stat.st_mtime_ns): continue
+            updates.append((filename, match.group(1), int(match.group(2)), stat))
+        self.update(path, updates)
+        removed = set(known) - seen
+        self.connection.executemany('DELETE FROM pieces WHERE directory = ? AND filename = ?', [(path, f) for f in removed])
+        self.connection.execute('INSERT OR REPLACE INTO directories VALUES (?, ?)', (path, mtime))
+        self.connection.commit()
+        print('Catalog refreshed: %s (%d pieces, %d updated, %d removed)' % (directory, len(seen), len(updates), len(removed)))
+
+    # Open files given as (filename, name, id, stat) under a directory and record their metadata.
+    def update(self, path, updates):
+
+        metadata = read_pieces_metadata([os.path.join(path, update[0]) for update in updates])
+        self.connection.executemany('INSERT OR REPLACE INTO pieces VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [
+            (path, filename, name, fid, stat.st_size, stat.st_mtime_ns, nentry, json.dumps(trees))
+            for ((filename, name, fid, stat), (nentry, trees)) in zip(updates, metadata)])
+
+    # Entry counts of the Events trees of arbitrary files, None for unreadable ones. A recorded count
+    # is reused while the file keeps its size and mtime; other files are opened concurrently.
+    def get_entries(self, files):
+
+        keys, updates = [], {}
+        for file in files:
+            path, filename = os.path.split(os.path.abspath(file))
+            try:
+                stat = os.stat(file)
+            except OSError:
+                keys.append(None)
+                continue
+            keys.append((path, filename))
+            row = self.connection.execute('SELECT size, mtime, nentry FROM pieces WHERE directory = ? AND filename = ?',
+                                          (path, filename)).fetchone()
+            if row is None or row[:2] != (stat.st_size, stat.st_mtime_ns) or row[2] is None:
+                match = re_piece.match(filename)
+                name, fid = (match.group(1), int(match.group(2))) if match else (filename, None)
+                updates.setdefault(path, []).append((filename, name, fid, stat))
+        for path, path_updates in updates.items():
+            self.update(path, path_updates)
+        self.connection.commit()
+        return [key and self.connection.execute('SELECT nentry FROM pieces WHERE directory = ? AND filename = ?', key).fetchone()[0]
+                for key in keys]
+
+    # Group piece paths of a directory by sample name, sorted by piece id.
+    def get_samples(self, directory):
+
+        self.refresh(directory)
+        samples = {}
+        for name, filename in self.connection.execute(
+                'SELECT name, filename FROM pieces WHERE directory = ? AND id IS NOT NULL ORDER BY name, id', (os.path.abspath(directory),)):
+            samples.setdefault(name, []).append(os.path.join(directory, filename))
+        return samples
+
+    # Look up records of the pieces of a sample.
+    def get_pieces(self, directory, name):
+
+        self.refresh(directory)
+        columns = ['filename', 'name', 'id', 'size', 'mtime', 'nentry', 'trees']
+        rows = self.connection.execute('SELECT %s FROM pieces WHERE directory = ? AND name = ? AND id IS NOT NULL ORDER BY id' % ', '.join(columns),
+                                       (os.path.abspath(directory), name))
+        return [dict(zip(columns, row[:-1] + (json.loads(row[-1]),))) for row in rows]
+
+    # Close the database.
+    def close(self):
+
+        self.connection.close()
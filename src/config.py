@@ -1,19 +1,110 @@
-import re
 import os
+import json
+import time
 import yaml
-import merge
+import expr
+import cache
+import catalog
 import math
+import pickle
+import hashlib
+import tempfile
+import merge
 
 basedir = os.path.join(os.path.dirname(__file__), '..')
+cachedir = os.path.join(basedir, '.cache', 'config')
+CACHE_ENTRIES = 256  # Pre-processed configurations kept, least recently used first out.
+
+# Modules whose code pre-processing depends on. A cached configuration is keyed by their sources.
+dependencies = [__file__, expr.__file__, cache.__file__, catalog.__file__, merge.__file__]
+
+# Use the C-accelerated YAML loader when available.
+Loader = getattr(yaml, 'CLoader', yaml.Loader)
+
+# Identify the listing of a directory by its mtime, the same criterion the sample catalog refreshes on.
+def get_listing_signature(path):
+
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
 
 class Config(dict):
 
-    # Load configuration from yaml file.
-    def __init__(self, filename, override={}):
+    # Load configuration from yaml file. A pre-processed configuration is reused while the yaml file,
+    # the overrides, the modules pre-processing depends on and the sample directory listing stay unchanged.
+    def __init__(self, filename, override={}, cache_dir=cachedir):
+
+        start = time.time()
+        with open(filename, 'rb') as file:
+            content = file.read()
+        key = hashlib.sha256(content + repr(sorted(override.items())).encode())
+        for dependency in dependencies:
+            with open(dependency, 'rb') as file:
+                key.update(file.read())
+        key = key.hexdigest()
+        cache_path = cache_dir and os.path.join(cache_dir, key + '.pkl')
+        cached = self.load_cache(cache_path)
+        if cached is not None:
+            dict.__init__(self, cached)
+        else:
+            dict.__init__(self, yaml.load(content, Loader))
+            self.update(override)
+            self.preproc()
+            self.save_cache(cache_path)
+        print('Config loaded in %.2f s (%s): %s' % (time.time() - start, 'cached' if cached is not None else 'parsed', filename))
+
+    # Signatures that a cached configuration depends on.
+    def get_signature(self):
+
+        return {
+            'sample-dir': self.get('sample-dir') and get_listing_signature(self['sample-dir']),
+        }
+
+    # Load a cached configuration if it is still valid.
+    def load_cache(self, path):
+
+        if not path: return None
+        try:
+            with open(path, 'rb') as file:
+                signature, cached = pickle.load(file)
+        except Exception:
+            return None
+        if Config.get_signature(cached) != signature: return None
+        os.utime(path)  # Mark as recently used.
+        return cached
+
+    # Save the pre-processed configuration.
+    def save_cache(self, path):
 
-        dict.__init__(self, yaml.load(open(filename), yaml.Loader))
-        self.update(override)
-        self.preproc()
+        if not path: return
+        # Each writer has its own temporary file, so that concurrent writers of an entry never interleave.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.tmp-', delete=False) as file:
+            try:
+                pickle.dump((self.get_signature(), dict(self)), file)
+            except BaseException:
+                file.close()
+                os.remove(file.name)
+                raise
+        os.replace(file.name, path)
+        self.evict_cache(os.path.dirname(path))
+
+    # Remove least recently used configurations beyond CACHE_ENTRIES.
+    def evict_cache(self, directory):
+
+        entries = []
+        for name in os.listdir(directory):
+            if not name.endswith('.pkl'): continue
+            try:
+                entries.append((os.stat(os.path.join(directory, name)).st_mtime, name))
+            except OSError:
+                continue
+        for _, name in sorted(entries)[:max(0, len(entries) - CACHE_ENTRIES)]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
 
     # Pre-process configuration.
     def preproc(self):
@@ -21,31 +112,57 @@ class Config(dict):
         # Compute weight and list files for each sample on demand.
         self['weight'] = self.get('weight', 'genWeight * l1PreFiringWeight * elEffWeight * muEffWeight * pileupJetIdWeight * topptWeightNNLO * vhWeightEWK * vvWeightNNLO * puWeight')
         self['maxevent'] = self.get('maxevent', 2**128 - 1)
+        self['step-size'] = self.get('step-size')
+        self['preview'] = self.get('preview')
+        self['workers'] = self.get('workers', 1)
+        self['cache-dir'] = self.get('cache-dir')
+        self['cache-size'] = self.get('cache-size', '20 GB')
+        self['store'] = self.get('store', 'hists.pkl')
+        self['cutflow'] = self.get('cutflow', 'cutflow.csv')
+        self['catalog'] = self.get('catalog', catalog.default_path)
+        self['merge-workers'] = self.get('merge-workers', 4)
+        self['merge-backend'] = self.get('merge-backend', 'hadd')
+        self['merge-preselection'] = self.get('merge-preselection')
+        self['merge-compression'] = self.get('merge-compression')
+        self['merge-shards'] = self.get('merge-shards', 1)
+        self['merge-balance'] = self.get('merge-balance', 'entries')
+        self['read-workers'] = self.get('read-workers', 4)
+        if self['merge-backend'] not in ['hadd', 'uproot']: raise ValueError('unknown merge backend: %s' % self['merge-backend'])
+        if self['merge-balance'] not in ['entries', 'bytes']: raise ValueError('unknown shard balance: %s' % self['merge-balance'])
         candidate_files = None
         for category in self['categories']:
             for sample in category['samples']:
                 sample['weight'] = sample.get('weight', self['weight'])
                 sample['maxevent'] = sample.get('maxevent', self['maxevent'])
+                sample['step-size'] = sample.get('step-size', self['step-size'])
+                sample['preview'] = sample.get('preview', self['preview'])
+                sample['merge-preselection'] = sample.get('merge-preselection', self['merge-preselection'])
+                sample['merge-shards'] = sample.get('merge-shards', self['merge-shards'])
+                if self.get('do-not-list'): sample.setdefault('files', [])
                 if 'files' not in sample:
                     if candidate_files is None:
-                        # Group <self['sample-dir']>/<name>_<id>_tree.root by name.
-                        candidate_files = {}
-                        files = map(lambda s: s.rsplit('_', 2), os.listdir(self['sample-dir']))
-                        files = sorted((f[0], int(f[1])) for f in files if len(f) == 3 and f[2] == 'tree.root')
-                        for fname, fid in files:
-                            if fname not in candidate_files: candidate_files[fname] = []
-                            candidate_files[fname].append(fid)
-                    sample['files'] = [os.path.join(self['sample-dir'], '_'.join([sample['name'], str(fid), 'tree.root']))
-                                       for fid in candidate_files.get(sample['name'], [])]
-                if not self.get('do-not-merge') and not sample.get('do-not-merge') and 'merged-file' not in sample:
+                        # Look up <self['sample-dir']>/<name>_<id>_tree.root grouped by name in the catalog.
+                        sample_catalog = catalog.Catalog(self['catalog'])
+                        candidate_files = sample_catalog.get_samples(self['sample-dir'])
+                        sample_catalog.close()
+                    sample['files'] = candidate_files.get(sample['name'], [])
+                # Merging is deferred to run(), which merges samples concurrently as it needs them.
+                sample['merge'] = not self.get('do-not-merge') and not sample.get('do-not-merge') and 'merged-file' not in sample \
+                    and bool(sample['files'])
+                if sample['merge']:
                     sample['merged-file'] = os.path.join(self['merged-sample-dir'], '_'.join([sample['name'], 'bigtree.root']))
-                    merge.update_merged_root_file(sample['files'], sample['merged-file'])
 
         # Complete histogram attributes.
         for hist in self['hists']:
             hist['preliminary'] = hist.get('preliminary', True)
             hist['supplementary'] = hist.get('supplementary', False)
             hist['window'] = eval(hist.get('window', '[-inf, +inf]'), {'inf': math.inf})
+            hist['binning'] = hist.get('binning', 'linear')
+            hist['bins'] = hist.get('bins')
+            if isinstance(hist['bins'], str):
+                hist['bins'] = eval(hist['bins'], {'inf': math.inf})
+            if hist['bins'] is not None:
+                hist['nbin'], hist['lb'], hist['ub'] = len(hist['bins']) - 1, hist['bins'][0], hist['bins'][-1]
             hist['xlabel'] = hist.get('xlabel', hist['name'])
             hist['ylabel'] = hist.get('ylabel', 'number')
             hist['xscale'] = hist.get('xscale', 'linear')
@@ -67,14 +184,69 @@ class Config(dict):
                                                    9 * sum(hist['subplot-ratios-y']) / hist['subplot-ratios-y'][0]))
             hist['dpi'] = hist.get('dpi', 150)
 
-        # List active branches on demand.
-        if 'active-branches' not in self:
-            re_identifier = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
-            active_branches = set()
-            for hist in self['hists']:
-                for branch in re_identifier.findall(hist['expr']):
-                    active_branches.add(branch)
-            self['active-branches'] = sorted(active_branches)
+        # Complete the optional cube, an N-dimensional histogram over axes described like hists. Without
+        # declared axes, it has one axis per distinct expression and binning of the hists.
+        self['cube'] = self.get('cube')
+        if self['cube'] is not None:
+            self['cube'] = dict(self['cube'] or {})
+            if 'axes' not in self['cube']:
+                axes = {}
+                for hist in self['hists']:
+                    axis = {key: hist[key] for key in ['name', 'expr', 'nbin', 'lb', 'ub', 'binning', 'bins'] if key in hist}
+                    axes.setdefault((cache.normalize_expression(hist['expr']), hist.get('nbin'), hist.get('lb'), hist.get('ub'),
+                                     hist['binning'], str(hist['bins'])), axis)
+                self['cube']['axes'] = list(axes.values())
+            for axis in self['cube']['axes']:
+                axis['binning'] = axis.get('binning', 'linear')
+                axis['bins'] = axis.get('bins')
+                if isinstance(axis['bins'], str):
+                    axis['bins'] = eval(axis['bins'], {'inf': math.inf})
+                if axis['bins'] is not None:
+                    axis['nbin'], axis['lb'], axis['ub'] = len(axis['bins']) - 1, axis['bins'][0], axis['bins'][-1]
+            self['cube']['memory'] = self['cube'].get('memory', '1 GB')
+
+        # Complete regions and weight variations, given as lists of {name, expr} or mappings from names to expressions.
+        for key in ['regions', 'weight-variations']:
+            self[key] = self.get(key) or []
+            if isinstance(self[key], dict):
+                self[key] = [{'name': name, 'expr': expression} for (name, expression) in self[key].items()]
+        for region in self['regions']:
+            region['branches'] = expr.Plan([region['expr']]).branches
+
+        # A weight variation may refer to the nominal weight of each sample as `weight`.
+        for category in self['categories']:
+            for sample in category['samples']:
+                sample['weight-variations'] = [expr.substitute(variation['expr'], 'weight', sample['weight'])
+                                               for variation in self['weight-variations']]
+
+        # Resolve branches each hist, region and weight depends on. List active branches on demand.
+        for hist in self['hists']:
+            hist['branches'] = expr.Plan([hist['expr']]).branches
+        for axis in (self['cube'] or {}).get('axes', []):
+            axis['branches'] = expr.Plan([axis['expr']]).branches
+        hist_branches = set(branch for item in self['hists'] + self['regions'] + (self['cube'] or {}).get('axes', [])
+                            for branch in item['branches'])
+        active_branches = set(self.get('active-branches', []))
+        for category in self['categories']:
+            for sample in category['samples']:
+                if 'active-branches' not in self:
+                    sample['active-branches'] = sorted(hist_branches.union(expr.Plan([sample['weight'], *sample['weight-variations']]).branches))
+                else:
+                    sample['active-branches'] = self['active-branches']
+                active_branches.update(sample['active-branches'])
+
+                # A slimmed merged file is named after what it holds, so configs with the same needs share it.
+                sample['merge-slim'] = None
+                if sample['merge'] and self['merge-backend'] == 'uproot':
+                    sample['merge-slim'] = {'branches': sample['active-branches'], 'preselection': sample['merge-preselection'],
+                                            'weight': sample['weight'], 'compression': self['merge-compression']}
+                    key = hashlib.sha1(json.dumps(sample['merge-slim'], sort_keys=True).encode()).hexdigest()[:12]
+                    sample['merged-file'] = os.path.join(self['merged-sample-dir'], '_'.join([sample['name'], 'bigtree', key + '.root']))
+
+                # Sharded samples are merged into files listed by an index file in place of a single merged file.
+                if sample['merge'] and sample['merge-shards'] > 1:
+                    sample['merged-index'] = '%s_%s-%d_index.json' % (sample.pop('merged-file')[:-len('.root')], self['merge-balance'], sample['merge-shards'])
+        self['active-branches'] = sorted(active_branches)
 
 if __name__ == '__main__':
 
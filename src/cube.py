@@ -0,0 +1,138 @@
+import math
+import numpy as np
+import fill
+
+EDGE_TOLERANCE = 1e-9  # Relative tolerance of window bounds on bin edges, against rounding of the edges.
+
+# Map values to slots of a cube axis: underflow, the bins, overflow and NaN.
+def get_slots(value, bins, uniform=True):
+
+    value = np.asarray(value, dtype='float64')
+    nbin = len(bins) - 1
+    slot = fill.get_indices(value, bins, uniform) + 1  # Out-of-range values land in the overflow slot.
+    slot[value < bins[0]] = 0
+    slot[np.isnan(value)] = nbin + 2
+    return slot
+
+# Index of the edge of bins a window bound falls on, or None. Bounds are matched up to rounding, so that a decimal
+# bound such as 0.3 matches the edge of linearly spaced bins computed as 0.30000000000000004.
+def find_edge(bins, value):
+
+    i = int(np.abs(bins - value).argmin())
+    return i if math.isclose(bins[i], value, rel_tol=EDGE_TOLERANCE, abs_tol=EDGE_TOLERANCE * (bins[-1] - bins[0])) else None
+
+# Range of slots of an axis whose values pass a window [lb, ub], inclusive, or None if slots cannot express it.
+# A value on an inner edge is in the bin above it, and one on the last edge in the last bin, so the lower bound
+# must be an edge below the last and the upper bound the last edge or infinite.
+def get_slot_range(bins, window):
+
+    bins = np.asarray(bins, dtype='float64')
+    lb, ub = window
+    if lb == -math.inf:
+        begin = 0
+    else:
+        i = find_edge(bins, lb)
+        if i is None or i == len(bins) - 1: return None
+        begin = i + 1
+    if ub == math.inf:
+        end = len(bins) + 1
+    elif find_edge(bins, ub) == len(bins) - 1:
+        end = len(bins)
+    else:
+        return None
+    return begin, end
+
+class Cube:
+
+    # An N-dimensional histogram over axes described like hists, with nweight weight columns. It is dense
+    # while counts and sumw2 fit in budget bytes, and sparse over occupied cells otherwise.
+    def __init__(self, axes, nweight=1, budget=None):
+
+        self.bins = [fill.get_bins(axis) for axis in axes]
+        self.uniform = [fill.is_uniform(axis) for axis in axes]
+        self.shape = tuple(len(bins) + 2 for bins in self.bins)  # underflow, nbin bins, overflow, NaN
+        self.nweight = nweight
+        self.size = int(np.prod(self.shape, dtype='float64'))
+        self.dense = budget is None or 2 * 8 * nweight * self.size <= budget
+        self.cells = None if self.dense else np.empty(0, dtype='int64')
+        ncell = self.size if self.dense else 0
+        self.counts = np.zeros((nweight, ncell))
+        self.sumw2 = np.zeros((nweight, ncell))
+
+    # Fill the cube from values of the axes and weight columns shaped (nweight, nevent).
+    def fill(self, values, weights):
+
+        if not values: return
+        weights = np.asarray(weights, dtype='float64').reshape(self.nweight, -1)
+        block_size = max(1024, fill.BLOCK_SIZE // self.nweight)
+        for begin in range(0, len(values[0]), block_size):
+            end = begin + block_size
+            cell = np.ravel_multi_index([get_slots(value[begin:end], bins, uniform) for (value, bins, uniform)
+                                         in zip(values, self.bins, self.uniform)], self.shape).astype('int64')
+            weight = weights[:, begin:end]
+            if self.dense:
+                self.add_cells(cell, weight, weight * weight)
+            else:
+                cells, inverse = np.unique(cell, return_inverse=True)
+                self.merge(cells, *[self.sum_by_cell(inverse, len(cells), w) for w in [weight, weight * weight]])
+
+    # Sum weight columns of events by cell index, given in [0, ncell).
+    def sum_by_cell(self, cell, ncell, weight):
+
+        index = (cell + np.arange(self.nweight)[:, np.newaxis] * ncell).ravel()
+        return np.bincount(index, weights=weight.ravel(), minlength=self.nweight * ncell).reshape(self.nweight, ncell)
+
+    # Add weight columns of events to cells of a dense cube.
+    def add_cells(self, cell, weight, weight2):
+
+        self.counts += self.sum_by_cell(cell, self.size, weight)
+        self.sumw2 += self.sum_by_cell(cell, self.size, weight2)
+
+    # Merge sums over sorted unique cells into a sparse cube.
+    def merge(self, cells, counts, sumw2):
+
+        self.cells, inverse = np.unique(np.concatenate([self.cells, cells]), return_inverse=True)
+        self.counts = self.sum_by_cell(inverse, len(self.cells), np.concatenate([self.counts, counts], axis=1))
+        self.sumw2 = self.sum_by_cell(inverse, len(self.cells), np.concatenate([self.sumw2, sumw2], axis=1))
+
+    # Add another cube over the same axes with weights scaled.
+    def add(self, other, scale=1.0):
+
+        if self.dense and other.dense:
+            self.counts += other.counts * scale
+            self.sumw2 += other.sumw2 * scale**2
+        elif self.dense:
+            self.counts[:, other.cells] += other.counts * scale
+            self.sumw2[:, other.cells] += other.sumw2 * scale**2
+        else:
+            cells = np.arange(other.size) if other.dense else other.cells
+            self.merge(cells, other.counts * scale, other.sumw2 * scale**2)
+        return self
+
+    # Project onto an axis with slot ranges {axis: (begin, end)} applied to other axes. Return counts and
+    # sumw2 of the bins of the axis, shaped (nweight, nbin).
+    def project(self, axis, ranges={}):
+
+        nbin = len(self.bins[axis]) - 1
+        if self.dense:
+            counts, sumw2 = [a.reshape((self.nweight,) + self.shape) for a in [self.counts, self.sumw2]]
+            selection = [slice(None)] + [slice(*ranges[i]) if i in ranges and i != axis else slice(None) for i in range(len(self.shape))]
+            others = tuple(1 + i for i in range(len(self.shape)) if i != axis)
+            counts, sumw2 = [a[tuple(selection)].sum(axis=others) for a in [counts, sumw2]]
+            if axis in ranges:
+                outside = np.ones(self.shape[axis], dtype=bool)
+                outside[slice(*ranges[axis])] = False
+                counts[:, outside] = sumw2[:, outside] = 0.0
+            return [a[:, 1:nbin + 1] for a in [counts, sumw2]]
+        slots = np.unravel_index(self.cells, self.shape)
+        keep = np.ones(len(self.cells), dtype=bool)
+        for i, (begin, end) in ranges.items():
+            keep &= (begin <= slots[i]) & (slots[i] < end)
+        keep &= (1 <= slots[axis]) & (slots[axis] <= nbin)
+        bins = slots[axis][keep] - 1
+        return [self.sum_by_cell(bins, nbin, a[:, keep]) for a in [self.counts, self.sumw2]]
+
+    # Describe the layout of the cube.
+    def __str__(self):
+
+        return '%s %s cells x %d weights' % ('dense' if self.dense else 'sparse', 'x'.join(map(str, self.shape)), self.nweight)
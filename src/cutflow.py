@@ -0,0 +1,95 @@
+import csv
+import numpy as np
+
+DENSE_NCUT_MAX = 16  # Up to this many cuts, patterns are counted with a dense bincount.
+
+# Pack window decisions into one bitmask per event. Bit i is set when values[i] lies in windows[i].
+def get_mask(values, windows):
+
+    if len(windows) > 64: raise ValueError('at most 64 cuts are supported')
+    dtype = np.min_scalar_type(2**len(windows) - 1) if windows else np.dtype('uint8')
+    mask = np.zeros(len(values[0]) if len(values) else 0, dtype=dtype)
+    for i, (value, window) in enumerate(zip(values, windows)):
+        np.bitwise_or(mask, np.logical_and(window[0] <= value, value <= window[1]) * dtype.type(1 << i), out=mask)
+    return mask
+
+# Whether all bits of required are set in each mask.
+def has_all(mask, required):
+
+    required = mask.dtype.type(required)
+    return (mask & required) == required
+
+# Count events with nonzero weight and sum weights per pattern of passed cuts.
+def count_patterns(mask, weight, ncut):
+
+    nonzero = (weight != 0).astype('float64')
+    if ncut <= DENSE_NCUT_MAX:
+        mask = mask.astype(np.intp)
+        nraw = np.bincount(mask, weights=nonzero, minlength=2**ncut)
+        sumw = np.bincount(mask, weights=weight, minlength=2**ncut)
+        patterns = np.flatnonzero(np.logical_or(nraw, sumw))
+        nraw, sumw = nraw[patterns], sumw[patterns]
+    else:
+        patterns, inverse = np.unique(mask, return_inverse=True)
+        nraw = np.bincount(inverse, weights=nonzero, minlength=len(patterns))
+        sumw = np.bincount(inverse, weights=weight, minlength=len(patterns))
+    return {int(p): [int(n), float(w)] for (p, n, w) in zip(patterns, nraw, sumw)}
+
+# Merge pattern counts into an accumulator with weight sums scaled.
+def add_patterns(total, patterns, scale=1.0):
+
+    for pattern, (nraw, sumw) in patterns.items():
+        entry = total.setdefault(pattern, [0, 0.0])
+        entry[0] += nraw
+        entry[1] += sumw * scale
+    return total
+
+# Sum counts and weights over patterns in which all bits of required are set.
+def select(patterns, required):
+
+    nraw, sumw = 0, 0.0
+    for pattern, (n, w) in patterns.items():
+        if pattern & required == required:
+            nraw += n
+            sumw += w
+    return nraw, sumw
+
+# Build rows of individual, sequential and N-1 yields and efficiencies, one per cut.
+def get_table(patterns, ncut):
+
+    full = 2**ncut - 1
+    total = select(patterns, 0)
+    final = select(patterns, full)
+    rows = []
+    for i in range(ncut):
+        individual = select(patterns, 1 << i)
+        sequential_before = select(patterns, (1 << i) - 1)
+        sequential = select(patterns, (1 << (i + 1)) - 1)
+        n_minus_1 = select(patterns, full & ~(1 << i))
+        rows.append({
+            'individual': individual, 'individual-eff': get_efficiencies(individual, total),
+            'sequential': sequential, 'sequential-eff': get_efficiencies(sequential, sequential_before),
+            'n-1': n_minus_1, 'n-1-eff': get_efficiencies(final, n_minus_1),
+        })
+    return rows
+
+# Raw and weighted efficiencies of passing counts relative to reference counts.
+def get_efficiencies(passed, reference):
+
+    return tuple(p / r if r else 0.0 for (p, r) in zip(passed, reference))
+
+# Export cutflow tables of all categories to a CSV file.
+def export(path, hists, cutflows):
+
+    columns = ['category', 'cut', 'hist', 'window']
+    for kind in ['individual', 'sequential', 'n-1']:
+        columns += [kind + '-raw', kind + '-weighted', kind + '-eff-raw', kind + '-eff-weighted']
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for name, patterns in cutflows:
+            for i, (hist, row) in enumerate(zip(hists, get_table(patterns, len(hists)))):
+                line = [name, i, hist['name'], '[%g, %g]' % tuple(hist['window'])]
+                for kind in ['individual', 'sequential', 'n-1']:
+                    line += [row[kind][0], '%g' % row[kind][1], '%g' % row[kind + '-eff'][0], '%g' % row[kind + '-eff'][1]]
+                writer.writerow(line)
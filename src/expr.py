@@ -0,0 +1,214 @@
+import re
+import ast
+import operator
+import numpy as np
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+    ast.LShift: operator.lshift, ast.RShift: operator.rshift,
+}
+UNARY_OPERATORS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Invert: operator.invert, ast.Not: np.logical_not}
+COMPARE_OPERATORS = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+BOOL_OPERATORS = {ast.And: np.logical_and, ast.Or: np.logical_or}
+GETTER = 'get'
+
+# Functions available in expressions, the same as uproot's Python language.
+def get_functions():
+
+    import uproot
+    return uproot.language.python.PythonLanguage.default_functions
+
+# Convert a chain of attributes like a.b.c to a dotted branch name.
+def get_dotted_name(node):
+
+    if isinstance(node, ast.Name): return node.id
+    if isinstance(node, ast.Attribute):
+        name = get_dotted_name(node.value)
+        if name is not None: return name + '.' + node.attr
+    return None
+
+# Build a tuple of subscript indices, like a[i, j].
+def make_tuple(*items):
+
+    return items
+
+# Replace a name in an expression with a parenthesized subexpression.
+def substitute(expression, name, replacement):
+
+    return re.sub(r'(?<![\w.])%s(?![\w])' % re.escape(name), lambda match: '(%s)' % replacement, expression)
+
+# Replace branch references in an AST, like uproot's Python language: names and dotted names that are not
+# functions, and get('name'). Each is replaced by the node returned by branch(name).
+def rewrite_branches(node, functions, branch):
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        if node.func.id == GETTER and len(node.args) == 1 and isinstance(node.args[0], ast.Constant):
+            return branch(node.args[0].value)
+        if node.func.id in functions:
+            node.args = [rewrite_branches(arg, functions, branch) for arg in node.args]
+            node.keywords = [rewrite_branches(keyword, functions, branch) for keyword in node.keywords]
+            return node
+    if isinstance(node, ast.Name):
+        return node if node.id in functions else branch(node.id)
+    name = get_dotted_name(node)
+    if name is not None:
+        return branch(name)
+    for field, value in ast.iter_fields(node):
+        if isinstance(value, ast.AST):
+            setattr(node, field, rewrite_branches(value, functions, branch))
+        elif isinstance(value, list):
+            setattr(node, field, [rewrite_branches(item, functions, branch) if isinstance(item, ast.AST) else item for item in value])
+    return node
+
+class Fallback:
+
+    # Evaluate a subexpression the plan does not lower with Python, the way uproot does. Its branches are
+    # given as positional arguments, bound to the names _0, _1, ... of the rewritten source.
+    def __init__(self, source):
+
+        self.source = source
+
+    # Evaluate on values of the branches.
+    def __call__(self, *args):
+
+        scope = dict(get_functions())
+        scope.update(('_%d' % i, arg) for (i, arg) in enumerate(args))
+        return eval(compile(self.source, '<expression>', 'eval'), scope)
+
+    # Compare by source, so that identical subexpressions are interned once.
+    def __eq__(self, other):
+
+        return isinstance(other, Fallback) and self.source == other.source
+
+    def __hash__(self):
+
+        return hash(self.source)
+
+    # Describe the subexpression.
+    def __repr__(self):
+
+        return 'Fallback(%r)' % self.source
+
+class Plan:
+
+    # Parse expressions into a graph of unique subexpressions, so that identical
+    # expressions and shared subterms are evaluated once per chunk.
+    def __init__(self, expressions):
+
+        self.functions = get_functions()
+        self.nodes = []  # (kind, payload, argument node ids) in evaluation order
+        self.ids = {}
+        self.expressions = list(expressions)
+        self.outputs = [self.add(ast.parse(expression.strip(), mode='eval').body) for expression in self.expressions]
+        self.unique = list(dict.fromkeys(self.outputs))
+        self.index = [self.unique.index(output) for output in self.outputs]
+        self.unique_expressions = [self.expressions[self.outputs.index(output)] for output in self.unique]
+        self.branches = sorted(payload for (kind, payload, _) in self.nodes if kind == 'branch')
+
+    # Add a node unless an identical one exists. Return its id.
+    def intern(self, kind, payload, args=()):
+
+        key = (kind, payload if kind != 'const' else (type(payload), repr(payload)), tuple(args))
+        if key not in self.ids:
+            self.ids[key] = len(self.nodes)
+            self.nodes.append((kind, payload, tuple(args)))
+        return self.ids[key]
+
+    # Add an AST node and its children. Operations on constants are folded.
+    def add(self, node):
+
+        if isinstance(node, ast.Constant):
+            return self.intern('const', node.value)
+        name = get_dotted_name(node)
+        if name is not None:
+            return self.intern('branch', name)
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            return self.apply(BINARY_OPERATORS[type(node.op)], [node.left, node.right])
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+            return self.apply(UNARY_OPERATORS[type(node.op)], [node.operand])
+        if isinstance(node, ast.BoolOp):
+            args = [self.add(value) for value in node.values]
+            while len(args) > 1:
+                args = [self.apply(BOOL_OPERATORS[type(node.op)], args[:2])] + args[2:]
+            return args[0]
+        if isinstance(node, ast.Compare):
+            operands = [node.left] + node.comparators
+            args = [self.apply(COMPARE_OPERATORS[type(op)], operands[i:i + 2]) for (i, op) in enumerate(node.ops)]
+            while len(args) > 1:
+                args = [self.apply(np.logical_and, args[:2])] + args[2:]
+            return args[0]
+        if isinstance(node, ast.IfExp):
+            return self.apply(np.where, [node.test, node.body, node.orelse])
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            if node.func.id == GETTER and len(node.args) == 1 and isinstance(node.args[0], ast.Constant):
+                return self.intern('branch', node.args[0].value)
+            if node.func.id in self.functions:
+                return self.apply(self.functions[node.func.id], node.args)
+        if isinstance(node, ast.Subscript):
+            return self.apply(operator.getitem, [node.value, self.add_index(node.slice)])
+        return self.add_fallback(node)
+
+    # Add the index of a subscript: a slice, a tuple of indices or an expression.
+    def add_index(self, node):
+
+        if isinstance(node, ast.Slice):
+            return self.apply(slice, [part or ast.Constant(None) for part in [node.lower, node.upper, node.step]])
+        if isinstance(node, ast.Tuple):
+            return self.apply(make_tuple, [self.add_index(element) for element in node.elts])
+        return self.add(node)
+
+    # Add a subexpression evaluated by Python, for syntax the plan does not lower. Its branches are still
+    # read as nodes of the plan.
+    def add_fallback(self, node):
+
+        args = []
+        def branch(name):
+            args.append(self.intern('branch', name))
+            return ast.Name('_%d' % (len(args) - 1), ast.Load())
+        node = rewrite_branches(ast.parse(ast.unparse(node), mode='eval').body, self.functions, branch)
+        return self.intern('call', Fallback(ast.unparse(node)), args)
+
+    # Add an operation applied to AST or already added nodes.
+    def apply(self, function, args):
+
+        args = [arg if isinstance(arg, int) else self.add(arg) for arg in args]
+        if all(self.nodes[arg][0] == 'const' for arg in args):
+            return self.intern('const', function(*[self.nodes[arg][1] for arg in args]))
+        return self.intern('call', function, args)
+
+    # Evaluate unique outputs from a mapping of branch names to arrays.
+    def evaluate(self, arrays):
+
+        values = []
+        for kind, payload, args in self.nodes:
+            if kind == 'branch':
+                values.append(arrays[payload])
+            elif kind == 'const':
+                values.append(payload)
+            else:
+                values.append(payload(*[values[arg] for arg in args]))
+        return [values[output] for output in self.unique]
+
+    # Pickle without the function table, which is only needed for parsing, so that a plan compiled once can be
+    # handed to worker processes.
+    def __getstate__(self):
+
+        state = dict(self.__dict__)
+        del state['functions']
+        return state
+
+    # Expand unique outputs to one value per input expression.
+    def fan_out(self, columns):
+
+        return [columns[i] for i in self.index]
+
+    # Describe the saving of the plan.
+    def __str__(self):
+
+        return '%d expressions, %d unique, %d operations, %d branches' % (
+            len(self.expressions), len(self.unique), sum(node[0] == 'call' for node in self.nodes), len(self.branches))
@@ -0,0 +1,76 @@
+import numpy as np
+
+BLOCK_SIZE = 16384  # Events per fill block, small enough to keep temporaries in cache.
+
+# Compute bin edges of a histogram: explicit edges, log-spaced or uniform bins.
+def get_bins(hist):
+
+    if hist.get('bins') is not None:
+        return np.asarray(hist['bins'], dtype='float64')
+    if hist.get('binning') == 'log':
+        return np.geomspace(hist['lb'], hist['ub'], hist['nbin'] + 1)
+    return np.histogram_bin_edges([], bins=hist['nbin'], range=(hist['lb'], hist['ub']))
+
+# Whether bins of a histogram have a fixed width.
+def is_uniform(hist):
+
+    return hist.get('bins') is None and hist.get('binning', 'linear') == 'linear'
+
+# Map values to bin indices with the same conventions as np.histogram. The last bin is closed.
+# Out-of-range and NaN values are mapped to nbin, which serves as a sink slot.
+def get_indices(value, bins, uniform=True):
+
+    value = np.asarray(value, dtype='float64')
+    nbin = len(bins) - 1
+    keep = np.logical_and(bins[0] <= value, value <= bins[-1])
+    if uniform:
+        # Compute indices arithmetically and correct the rounding against the edges.
+        index = np.where(keep, (value - bins[0]) * (nbin / (bins[-1] - bins[0])), 0.0).astype(np.intp)
+        index[index == nbin] -= 1
+        index[value < bins[index]] -= 1
+        index[np.logical_and(value >= bins[index + 1], index != nbin - 1)] += 1
+    else:
+        # Fall back to a binary search over variable edges.
+        index = np.searchsorted(bins, value, side='right') - 1
+        index[value == bins[-1]] = nbin - 1
+    index[~keep] = nbin
+    return index
+
+class Filler:
+
+    # Allocate counts and sum of weights squared of nweight weight columns for all histograms in one flat buffer.
+    def __init__(self, hists, nweight=1):
+
+        self.bins = [get_bins(hist) for hist in hists]
+        self.uniform = [is_uniform(hist) for hist in hists]
+        self.offsets = np.cumsum([0] + [len(bins) for bins in self.bins])  # nbin + 1 slots per histogram
+        self.nweight = nweight
+        self.counts = np.zeros((nweight, self.offsets[-1]))
+        self.sumw2 = np.zeros((nweight, self.offsets[-1]))
+
+    # Fill all histograms from one chunk. Each histogram has its own values, and takes the weight columns of
+    # the chunk, shaped (nweight, nevent), multiplied by its own mask. Events are processed in cache-sized
+    # blocks; bin indices are computed once per block and shared by all weight columns, which are
+    # accumulated by one bincount over a (weight column, slot) index.
+    def fill(self, values, weights, masks):
+
+        if not values: return
+        weights = np.asarray(weights, dtype='float64').reshape(self.nweight, -1)
+        nslot = self.offsets[-1]
+        block_size = max(1024, BLOCK_SIZE // self.nweight)
+        for begin in range(0, len(values[0]), block_size):
+            end = begin + block_size
+            index = np.concatenate([get_indices(value[begin:end], bins, uniform) + offset for (value, bins, uniform, offset)
+                                    in zip(values, self.bins, self.uniform, self.offsets)])
+            weight = np.concatenate([weights[:, begin:end] * mask[begin:end] for mask in masks], axis=1)
+            if self.nweight > 1:
+                index = (index + np.arange(self.nweight)[:, np.newaxis] * nslot).ravel()
+            weight = weight.ravel()
+            self.counts += np.bincount(index, weights=weight, minlength=self.counts.size).reshape(self.counts.shape)
+            self.sumw2 += np.bincount(index, weights=weight * weight, minlength=self.sumw2.size).reshape(self.sumw2.shape)
+
+    # Return (counts, sumw2) of the i-th histogram without the sink slot, shaped (nweight, nbin).
+    def get(self, i):
+
+        begin, end = self.offsets[i], self.offsets[i + 1] - 1
+        return self.counts[:, begin:end], self.sumw2[:, begin:end]
@@ -1,29 +1,259 @@
 #!/usr/bin/env python3
 
 import os
+import json
 import subprocess
+import threading
+import cache
+import catalog
+import concurrent.futures
+import numpy as np
 
-def merge_root_files(filein, fileout):
-    print('Generating:', fileout)
-    import uproot
-    filein = [file for file in filein if not print('Adding', file) and uproot.open(file)['Events'].num_entries]
+# Look up entry counts of inputs, refusing unreadable ones.
+def scan_inputs(filein, catalog_path=catalog.default_path):
+    sample_catalog = catalog.Catalog(catalog_path)
+    nentries = sample_catalog.get_entries(filein)
+    sample_catalog.close()
+    for file, nentry in zip(filein, nentries):
+        if nentry is None: raise RuntimeError('cannot read Events from %s' % file)
+    return nentries
+
+# Describe inputs by path, size, mtime, checksum of their head and tail, and entry count.
+def get_input_records(filein, nentries):
+    records = []
+    for file, nentry in zip(filein, nentries):
+        path, size, mtime, checksum = cache.get_file_identity(file)
+        records.append({'path': path, 'size': size, 'mtime': mtime, 'checksum': checksum, 'entries': nentry})
+    return records
+
+# Whether an input still matches its record. The checksum is only computed when the mtime moved.
+def is_input_unchanged(record):
+    try:
+        stat = os.stat(record['path'])
+    except OSError:
+        return False
+    if stat.st_size != record['size']: return False
+    return stat.st_mtime_ns == record['mtime'] or cache.get_file_identity(record['path'])[3] == record['checksum']
+
+# Load the manifest of a merged file, or None if it has none.
+def load_manifest(fileout):
+    try:
+        with open(fileout + '.json') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+# Write a JSON file atomically.
+def save_json(path, data):
+    with open(path + '.tmp', 'w') as file:
+        json.dump(data, file)
+    os.replace(path + '.tmp', path)
+
+# Save the manifest of a merged file.
+def save_manifest(fileout, manifest):
+    save_json(fileout + '.json', manifest)
+
+# Merge inputs with hadd. Given the manifest of fileout, only append the inputs to it.
+def merge_root_files(filein, fileout, catalog_path=catalog.default_path, manifest=None):
+    print('Generating:' if manifest is None else 'Appending:', fileout)
+    nentries = scan_inputs(filein, catalog_path)
+    records = get_input_records(filein, nentries)
+    filein = [file for (file, nentry) in zip(filein, nentries) if not print('Adding', file) and nentry]
     try:
-        subprocess.run(['rm', '-f', fileout])
-        subprocess.run(['mkdir', '-p', os.path.dirname(fileout)])
-        subprocess.run(['hadd', '-k', '-O', '-j', fileout] + filein).check_returncode()
+        subprocess.run(['rm', '-f', fileout + '.json'])
+        if manifest is None:
+            subprocess.run(['rm', '-f', fileout])
+            subprocess.run(['mkdir', '-p', os.path.dirname(fileout)])
+            subprocess.run(['hadd', '-k', '-O', '-j', fileout] + filein).check_returncode()
+        elif filein:
+            subprocess.run(['hadd', '-a', '-k', fileout] + filein).check_returncode()
+        save_manifest(fileout, {'inputs': (manifest['inputs'] if manifest else []) + records})
     except:
-        subprocess.run(['rm', '-f', fileout])
+        subprocess.run(['rm', '-f', fileout, fileout + '.json'])
         raise
 
+# Parse a compression setting like 'ZSTD:5' into an uproot compression object. None keeps uproot's default.
+def get_compression(compression):
+    import uproot
+    if compression is None: return uproot.ZLIB(1)
+    algorithm, _, level = compression.partition(':')
+    return getattr(uproot, algorithm.upper())(int(level or 1))
+
+# Merge inputs in process, writing only the given branches of events passing an optional preselection.
+# The entry count and weight sum of the inputs are saved to the manifest so that the preselected
+# events can be normalized to the full sample. Given the manifest of fileout, the events already
+# merged are copied over as they are and only the inputs are processed.
+def slim_root_files(filein, fileout, slim, catalog_path=catalog.default_path, manifest=None):
+    print('Generating:' if manifest is None else 'Appending:', fileout)
+    import uproot
+    import expr
+    nentries = scan_inputs(filein, catalog_path)
+    records = get_input_records(filein, nentries)
+    filein = [file for (file, nentry) in zip(filein, nentries) if not print('Adding', file) and nentry]
+    plan = expr.Plan([slim['weight']] + ([slim['preselection']] if slim['preselection'] else []))
+    branches = sorted(set(slim['branches']).union(plan.branches))
+    summary = {key: manifest[key] if manifest else 0 for key in ['nevent-in', 'nevent-out', 'weight-sum-in']}
+    sources = [([fileout + ':Events'], slim['branches'], None)] if manifest is not None else []
+    if filein: sources.append(([file + ':Events' for file in filein], branches, plan))
+    try:
+        os.makedirs(os.path.dirname(fileout), exist_ok=True)
+        with uproot.recreate(fileout + '.tmp', compression=get_compression(slim['compression'])) as output:
+            for files, source_branches, source_plan in sources:
+                for arrays in uproot.iterate(files, source_branches, step_size='100 MB', library='ak'):
+                    if source_plan is not None:
+                        weight, *selection = source_plan.fan_out(source_plan.evaluate(arrays))
+                        summary['nevent-in'] += len(arrays)
+                        summary['weight-sum-in'] += float(np.sum(np.broadcast_to(np.asarray(weight, dtype='float64'), len(arrays))))
+                        if selection: arrays = arrays[np.asarray(selection[0], dtype=bool)]
+                        summary['nevent-out'] += len(arrays)
+                    chunk = {branch: arrays[branch] for branch in slim['branches']}
+                    if 'Events' not in output:
+                        output.mktree('Events', {branch: array.type for (branch, array) in chunk.items()})
+                    if len(arrays): output['Events'].extend(chunk)
+        print('Slimmed: %s (%d/%d events, %d branches)' % (fileout, summary['nevent-out'], summary['nevent-in'], len(slim['branches'])))
+        if os.path.exists(fileout + '.json'): os.remove(fileout + '.json')
+        os.replace(fileout + '.tmp', fileout)
+        save_manifest(fileout, dict(summary, **slim, inputs=(manifest['inputs'] if manifest else []) + records))
+    finally:
+        if os.path.exists(fileout + '.tmp'): os.remove(fileout + '.tmp')
+
 def get_mtime(path):
     try:
         return os.stat(path).st_mtime
     except Exception:
         return 0.0
 
-def update_merged_root_file(filein, fileout):
+# Bring a merged file up to date with its manifest. New inputs are appended; changed or removed
+# inputs trigger a full rebuild. A file merged before manifests were kept is adopted if it is
+# newer than all its inputs.
+def update_merged_root_file(filein, fileout, catalog_path=catalog.default_path, slim=None):
     print('Checking:', fileout)
-    mtime_in = max(get_mtime(f) for f in filein)
-    mtime_out = get_mtime(fileout)
-    if mtime_in < mtime_out: return
-    merge_root_files(filein, fileout)
+    manifest = load_manifest(fileout) if os.path.exists(fileout) else None
+    if (manifest is None or 'inputs' not in manifest) and max(get_mtime(f) for f in filein) < get_mtime(fileout) \
+            and (slim is None or manifest is not None and 'nevent-in' in manifest):
+        print('Adopting:', fileout)
+        manifest = dict(manifest or {}, inputs=get_input_records(filein, scan_inputs(filein, catalog_path)))
+        save_manifest(fileout, manifest)
+    reason = None
+    if manifest is None or 'inputs' not in manifest:
+        reason = 'no manifest' if os.path.exists(fileout) else 'no merged file'
+    else:
+        paths = set(os.path.abspath(f) for f in filein)
+        removed = [record['path'] for record in manifest['inputs'] if record['path'] not in paths]
+        changed = [record['path'] for record in manifest['inputs'] if record['path'] in paths and not is_input_unchanged(record)]
+        if removed or changed:
+            reason = ', '.join('%d %s: %s' % (len(files), kind, ' '.join(files)) for (kind, files)
+                               in [('removed', removed), ('changed', changed)] if files)
+    if reason is not None:
+        print('Rebuilding: %s (%s)' % (fileout, reason))
+        manifest = None
+    else:
+        recorded = set(record['path'] for record in manifest['inputs'])
+        filein = [f for f in filein if os.path.abspath(f) not in recorded]
+        if not filein: return
+    if slim is None:
+        merge_root_files(filein, fileout, catalog_path, manifest)
+    else:
+        slim_root_files(filein, fileout, slim, catalog_path, manifest)
+
+# Path of the i-th shard listed by an index file <base>_index.json.
+def get_shard_path(index, i):
+    return index[:-len('_index.json')] + '_shard%d.root' % i
+
+# Load the shard files listed by an index file, or None if it does not exist.
+def load_index(index):
+    try:
+        with open(index) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+# Assign inputs to nshard shards balanced by entry count or file size, and save the index. Inputs keep
+# their shard across updates: removed ones leave it, so that its manifest triggers a rebuild of that
+# shard only, and new ones go to the least loaded shards. Return [(shard file, inputs)].
+def update_shard_index(filein, index, nshard, balance='entries', catalog_path=catalog.default_path):
+    paths = [os.path.abspath(f) for f in filein]
+    if balance == 'entries':
+        weights = dict(zip(paths, scan_inputs(filein, catalog_path)))
+    elif balance == 'bytes':
+        weights = {path: os.path.getsize(path) for path in paths}
+    else:
+        raise ValueError('unknown shard balance: %s' % balance)
+    old = load_index(index)
+    if old is not None and old['nshard'] == nshard and old['balance'] == balance:
+        assignment = {int(shard['id']): [path for path in shard['inputs'] if path in weights] for shard in old['shards']}
+        assignment = [assignment.get(i, []) for i in range(nshard)]
+    else:
+        assignment = [[] for i in range(nshard)]
+    assigned = set(path for inputs in assignment for path in inputs)
+    load = [sum(weights[path] for path in inputs) for inputs in assignment]
+    for path in sorted((path for path in paths if path not in assigned), key=lambda path: -weights[path]):
+        i = load.index(min(load))
+        assignment[i].append(path)
+        load[i] += weights[path]
+    order = {path: i for (i, path) in enumerate(paths)}
+    shards = [{'id': i, 'file': get_shard_path(index, i), 'inputs': sorted(inputs, key=order.get), 'load': load[i]}
+              for (i, inputs) in enumerate(assignment) if inputs]
+    files = set(shard['file'] for shard in shards)
+    for shard in (old or {}).get('shards', []):
+        if shard['file'] not in files:
+            print('Removing:', shard['file'])
+            subprocess.run(['rm', '-f', shard['file'], shard['file'] + '.json'])
+    os.makedirs(os.path.dirname(index), exist_ok=True)
+    save_json(index, {'nshard': nshard, 'balance': balance, 'shards': shards})
+    return [(shard['file'], shard['inputs']) for shard in shards]
+
+class Merger:
+
+    # Bring merged files up to date in background threads, at most nworker at a time.
+    def __init__(self, nworker=1, catalog_path=catalog.default_path):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max(1, nworker))
+        self.catalog_path = catalog_path
+        self.futures = {}
+
+    # Schedule an update of fileout from filein unless one is already scheduled. With nshard > 1, fileout
+    # is an index file. The index is updated in a background task, which then schedules each of its shards
+    # as a separate task, so that scanning inputs does not hold up the caller. Return a list of futures.
+    def submit(self, filein, fileout, slim=None, nshard=1, balance='entries'):
+        if fileout not in self.futures:
+            if nshard <= 1:
+                self.futures[fileout] = [self.executor.submit(update_merged_root_file, filein, fileout, self.catalog_path, slim)]
+            else:
+                done = concurrent.futures.Future()
+                self.executor.submit(self.submit_shards, filein, fileout, slim, nshard, balance, done)
+                self.futures[fileout] = [done]
+        return self.futures[fileout]
+
+    # Update the shard index of fileout and schedule an update of each of its shards. The done future
+    # completes when all shards are up to date, without holding a worker while they merge.
+    def submit_shards(self, filein, fileout, slim, nshard, balance, done):
+        try:
+            shards = update_shard_index(filein, fileout, nshard, balance, self.catalog_path)
+            futures = [self.executor.submit(update_merged_root_file, inputs, shard, self.catalog_path, slim)
+                       for (shard, inputs) in shards]
+        except BaseException as e:
+            done.set_exception(e)
+            return
+        pending = set(futures)
+        lock = threading.Lock()
+        def finish(future):
+            with lock:
+                pending.discard(future)
+                if pending: return
+            failed = [f for f in futures if f.cancelled() or f.exception() is not None]
+            if not failed:
+                done.set_result(None)
+            elif failed[0].cancelled():
+                done.cancel()
+            else:
+                done.set_exception(failed[0].exception())
+        if not futures: done.set_result(None)
+        for future in futures:
+            future.add_done_callback(finish)
+
+    def __enter__(self):
+        return self
+
+    # Wait for running merges. Pending ones are cancelled if the caller failed.
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.executor.shutdown(wait=True, cancel_futures=exc_type is not None)
@@ -1,3 +1,14 @@
+import math
+import pickle
+import itertools
+import concurrent.futures
+import cache
+import catalog
+import cube
+import cutflow
+import expr
+import fill
+import merge
 import mplhep as hep
 import numpy as np
 import uproot
@@ -14,160 +25,565 @@ def sort_names_and_counts(names, counts):
     items = sorted(((np.sum(count), name, count) for (name, count) in zip(names, counts)))
     return [item[1] for item in items], [item[2] for item in items]
 
-def run(config):
+# List input files of a sample, preferring the merged ones.
+def get_sample_files(sample):
+
+    if sample.get('merged-index'):
+        index = merge.load_index(sample['merged-index'])
+        return [shard['file'] for shard in index['shards']] if index else []
+    files = sample.get('merged-file')
+    if files:
+        return [files]
+    return sample['files']
+
+# Scan tree metadata of a file: its entry count, cluster offsets, and compressed bytes of the given
+# branches and of all branches. Report unreadable files and return None for them.
+def scan_file(file, branches):
+
+    try:
+        with uproot.open(file) as root_file:
+            tree = root_file['Events']
+            return (file, tree.num_entries, tree.common_entry_offsets(),
+                    sum(tree[branch].compressed_bytes for branch in branches if branch in tree), tree.compressed_bytes)
+    except Exception as e:
+        print('Skipping: %s (%s)' % (file, e))
+        return None
+
+# Select (start, stop) entry ranges of a scanned file. In preview mode, take an evenly spaced fraction
+# of its clusters; weight normalization corrects for the rest.
+def get_file_clusters(sample, scan):
+
+    _, nentry, offsets, _, _ = scan
+    if sample['preview'] is None: return [(0, nentry)]
+    clusters = list(zip(offsets[:-1], offsets[1:]))
+    nselect = min(len(clusters), max(1, math.ceil(sample['preview'] * len(clusters))))
+    return [clusters[int((i + 0.5) * len(clusters) / nselect)] for i in range(nselect)]
+
+# Scan tree metadata of the input files of a sample without reading any basket, nworker files at a time.
+# Files are scanned in order until the scanned ones cover the event budget. Unreadable files are skipped.
+# Return the scans and the files left unscanned.
+def scan_sample(sample, branches, nworker=1):
+
+    files = get_sample_files(sample)
+    scans, budget = [], sample['maxevent']
+    nworker = max(1, nworker)
+    with concurrent.futures.ThreadPoolExecutor(nworker) as executor:
+        for begin in range(0, len(files), nworker):
+            group = files[begin:begin + nworker]
+            for scan in (map if len(group) <= 1 else executor.map)(scan_file, group, itertools.repeat(branches)):
+                if scan is None: continue
+                scans.append(scan)
+                budget -= sum(stop - start for (start, stop) in get_file_clusters(sample, scan))
+            if budget <= 0: return scans, files[begin + nworker:]
+    return scans, []
+
+# Select (file, start, stop) entry ranges within the per-sample event budget.
+def get_entry_ranges(sample, scans):
+
+    ranges = []
+    budget = sample['maxevent']
+    for scan in scans:
+        file = scan[0]
+        for start, stop in get_file_clusters(sample, scan):
+            stop = min(stop, start + budget)
+            if stop <= start: break
+            ranges.append((file, start, stop))
+            budget -= stop - start
+        if budget <= 0: break
+    return ranges
+
+# Read branches in (start, stop) entry ranges of a file. Read a range at once unless a step size is given.
+def read_file_ranges(file, ranges, branches, step_size):
+
+    with uproot.open(file) as root_file:
+        tree = root_file['Events']
+        for start, stop in ranges:
+            if step_size is None:
+                yield tree.arrays(branches, entry_start=start, entry_stop=stop, library='np')
+            else:
+                yield from tree.iterate(branches, entry_start=start, entry_stop=stop, step_size=step_size, library='np')
+
+# Read branches in entry ranges, opening each file once. Without a step size, up to nworker files are read
+# concurrently and their chunks are yielded in order. With a step size, files are read one by one so that
+# memory usage stays bounded by the step size.
+def read_entry_ranges(ranges, branches, step_size, nworker=1):
+
+    groups = [(file, [(start, stop) for (_, start, stop) in group]) for file, group in itertools.groupby(ranges, key=lambda r: r[0])]
+    if step_size is not None or nworker <= 1 or len(groups) <= 1:
+        for file, group in groups:
+            yield from read_file_ranges(file, group, branches, step_size)
+        return
+    with concurrent.futures.ThreadPoolExecutor(nworker) as executor:
+        futures = []
+        for file, group in groups:
+            futures.append(executor.submit(lambda *args: list(read_file_ranges(*args)), file, group, branches, None))
+            if len(futures) >= nworker: yield from futures.pop(0).result()
+        for future in futures:
+            yield from future.result()
+
+# Open a sample for reading. Return the total entry count of its input files and a generator of chunks of
+# the unique columns of an expression plan. Only branches are read; expressions are evaluated by the plan.
+# Evaluated columns are served from and saved to the column cache when it is enabled.
+def read_sample(config, sample, plan):
+
+    files = get_sample_files(sample)
+    column_cache = None
+    if config['cache-dir']:
+        column_cache = cache.ColumnCache(config['cache-dir'], config['cache-size'])
+        columns = column_cache.load(files, plan.unique_expressions)
+        if columns is not None:
+            print('Loading from cache: %s' % sample['name'])
+            nevent = len(columns[0]) if columns else 0
+            return nevent, cache.iterate_columns([column[:sample['maxevent']] for column in columns], sample['step-size'])
+    branches = sample['active-branches']
+    scans, unscanned = scan_sample(sample, branches, config['read-workers'])
+    ranges = get_entry_ranges(sample, scans)
+    nevent = sum(scan[1] for scan in scans)
+    if unscanned:
+        # Entry counts of files beyond the budget are recorded in the catalog, which opens each file only once.
+        sample_catalog = catalog.Catalog(config['catalog'])
+        nevent += sum(nentry or 0 for nentry in sample_catalog.get_entries(unscanned))
+        sample_catalog.close()
+    nread = sum(stop - start for (_, start, stop) in ranges)
+    scans = {scan[0]: scan for scan in scans}
+    nbyte = sum(scans[file][3] * (stop - start) / scans[file][1] for (file, start, stop) in ranges)
+    nbyte_all = sum(scan[4] for scan in scans.values())
+    print('%s: reading %d branches, %d/%d entries from %d/%d files, %.1f MB of %.1f MB compressed' % (
+        sample['name'], len(branches), nread, nevent, len(set(r[0] for r in ranges)), len(files), nbyte / 1e6, nbyte_all / 1e6))
+    chunks = (plan.evaluate(chunk) for chunk in read_entry_ranges(ranges, branches, sample['step-size'], config['read-workers']))
+    if column_cache is not None and nread == nevent:
+        chunks = column_cache.store(files, plan.unique_expressions, chunks)
+    return nevent, chunks
+
+class Accumulator:
+
+    # Accumulate histograms and cutflow patterns of the hists of a config over chunks of a sample.
+    # Every hist is filled once per region and weight variation, in one multi-weight fill. With a cube,
+    # it is filled as well, and hists that are projections of it are no longer filled from events.
+    def __init__(self, config, sample):
+
+        self.config = config
+        self.sample = sample
+        self.regions = config['regions']
+        self.variations = sample['weight-variations']
+        self.expressions = [sample['weight'], *self.variations, *[region['expr'] for region in self.regions],
+                            *[hist['expr'] for hist in config['hists']]]
+        self.axes = get_axes(config)
+        self.projections = get_cube_projections(config)
+        self.filled = [i for i in range(len(config['hists'])) if i not in self.projections]
+        self.filler = fill.Filler([config['hists'][i] for i in self.filled], int(np.prod(self.axes)))
+        self.cube = None
+        if config['cube'] is not None:
+            self.cube = cube.Cube(config['cube']['axes'], int(np.prod(self.axes)), cache.parse_size(config['cube']['memory']))
+            self.expressions += [axis['expr'] for axis in config['cube']['axes']]
+        self.windows = [hist['window'] for hist in config['hists']]
+        self.patterns = {}
+        self.region_patterns = [{} for region in self.regions]
+        self.ntotal = 0
+
+    # Add a chunk of outputs of the expressions: event weights and their variations, region masks, values of
+    # the hists and values of the cube axes.
+    def add(self, outputs):
+
+        nvariation, nregion, ncut = len(self.variations), len(self.regions), len(self.windows)
+        weight, outputs = outputs[0], outputs[1:]
+        variations, outputs = outputs[:nvariation], outputs[nvariation:]
+        regions, outputs = outputs[:nregion], outputs[nregion:]
+        values, cube_values = outputs[:ncut], outputs[ncut:]
+        self.ntotal += len(weight)
+
+        # Evaluate all windows into one bitmask per event. Each hist takes events passing the windows
+        # before it, and events with zero weights are masked out.
+        weight = weight.astype('float64')
+        mask = cutflow.get_mask(values, self.windows)
+        cutflow.add_patterns(self.patterns, cutflow.count_patterns(mask, weight, ncut))
+        masks = [cutflow.has_all(mask, (1 << i) - 1) for i in range(ncut)]
+
+        # Build the weight matrix, one row per region and weight variation. Region masks are evaluated once.
+        weights = np.stack([weight] + [np.broadcast_to(np.asarray(v, dtype='float64'), weight.shape) for v in variations])
+        if nregion:
+            regions = np.stack([np.broadcast_to(np.asarray(region, dtype=bool), weight.shape) for region in regions])
+            for region, patterns in zip(regions, self.region_patterns):
+                cutflow.add_patterns(patterns, cutflow.count_patterns(mask, weight * region, ncut))
+            weights = (regions[:, np.newaxis, :] * weights[np.newaxis, :, :]).reshape(-1, len(weight))
+        self.filler.fill([values[i] for i in self.filled], weights, [masks[i] for i in self.filled])
+        if self.cube is not None:
+            self.cube.fill([np.broadcast_to(np.asarray(value, dtype='float64'), weight.shape) for value in cube_values], weights)
+
+    # Counts and sumw2 of a hist, shaped by the region and variation axes of the config.
+    def get_hist(self, i):
+
+        if i in self.projections:
+            counts, sumw2 = self.cube.project(*self.projections[i])
+        else:
+            counts, sumw2 = self.filler.get(self.filled.index(i))
+        return counts.reshape(self.axes + counts.shape[-1:]), sumw2.reshape(self.axes + sumw2.shape[-1:])
+
+    # Summarize the filled histograms, given the total entry count of the input files.
+    def get_result(self, nevent):
+
+        sample, patterns, ntotal = self.sample, self.patterns, self.ntotal
+        ncut = len(self.windows)
+        for i, hist in enumerate(self.config['hists']):
+            print('%s: %d/%d events in %s' % (sample['name'], cutflow.select(patterns, (1 << i) - 1)[0], ntotal, hist['name']))
+        nvalid, weight_sum = cutflow.select(patterns, 2**ncut - 1)
+        print('%s: %d/%d events in the end' % (sample['name'], nvalid, ntotal), flush=True)
+        weight_sum_before = cutflow.select(patterns, 0)[1]
+
+        # Events dropped by a merge preselection still count for normalization. The weight sum before it is taken
+        # pro rata of the slimmed entries actually read, like the weight sum of a partial read of an unslimmed sample.
+        preselected = sample.get('merge-slim') and sample['merge-slim']['preselection']
+        manifests = [merge.load_manifest(file) or {} for file in get_sample_files(sample)] if preselected else []
+        if preselected and all('nevent-in' in manifest for manifest in manifests):
+            nevent_in, nevent_out, weight_sum_in = [sum(manifest[key] for manifest in manifests) for key in ['nevent-in', 'nevent-out', 'weight-sum-in']]
+            fraction = ntotal / nevent_out if nevent_out else 1.0
+            nevent, weight_sum_before = nevent_in, weight_sum_in * fraction
+        hists = [self.get_hist(i) for i in range(len(self.config['hists']))]
+        return {
+            'nevent': nevent,
+            'counts': [hist[0] for hist in hists],
+            'sumw2': [hist[1] for hist in hists],
+            'nvalid': nvalid,
+            'weight-sum': weight_sum,
+            'weight-sum-before': weight_sum_before,
+            'cutflow': patterns,
+            'region-cutflows': self.region_patterns,
+            'cube': self.cube,
+        }
+
+# Fill histograms of a sample for several (config, sample) targets reading the same input files, in one read
+# of the union of their branches. Chunks are processed one by one so that memory usage is bounded by the
+# step size. Weights are not normalized here: counts and weight sums are scaled by the caller.
+def fill_shared_sample(targets):
+
+    config, sample = targets[0]
+    print('Processing: %s' % sample['name'], flush=True)
+    if not get_sample_files(sample): return [None] * len(targets)
+    accumulators = [Accumulator(*target) for target in targets]
+    plan = expr.Plan([expression for accumulator in accumulators for expression in accumulator.expressions])
+    offsets = list(itertools.accumulate([0] + [len(accumulator.expressions) for accumulator in accumulators]))
+    branches = sorted(set(branch for (_, target_sample) in targets for branch in target_sample['active-branches']))
+    try:
+        nevent, chunks = read_sample(config, dict(sample, **{'active-branches': branches}), plan)
+        chunks = iter(chunks)
+    except Exception as e:
+        print('Skipping: %s (%s)' % (sample['name'], e))
+        return [None] * len(targets)
+    while True:
+        # Only failures to read and evaluate the input skip the sample; errors filling it propagate.
+        try:
+            columns = next(chunks)
+        except StopIteration:
+            break
+        except Exception as e:
+            print('Skipping: %s (%s)' % (sample['name'], e))
+            return [None] * len(targets)
+        outputs = plan.fan_out(columns)
+        for accumulator, begin, end in zip(accumulators, offsets[:-1], offsets[1:]):
+            accumulator.add(outputs[begin:end])
+    return [accumulator.get_result(nevent) for accumulator in accumulators]
+
+# Fill histograms of a sample for a config.
+def fill_sample(config, sample):
+
+    return fill_shared_sample([(config, sample)])[0]
+
+# Schedule the merge of a sample if it needs one. Return a list of futures.
+def submit_merge(merger, config, sample):
+
+    if not sample['merge']: return []
+    return merger.submit(sample['files'], sample.get('merged-index') or sample['merged-file'], sample['merge-slim'],
+                         sample['merge-shards'], config['merge-balance'])
+
+# Fill groups of targets with one read per group, handing groups to a process pool if more than one worker
+# is configured. Results are yielded in order so that the reduction matches the serial one exactly.
+# Merges run in the background, and each group is read as soon as its own merge is done.
+def fill_groups(config, groups):
+
+    with merge.Merger(config['merge-workers'], config['catalog']) as merger:
+        merges = [submit_merge(merger, *group[0]) for group in groups]
+        if config['workers'] <= 1:
+            for group, merging in zip(groups, merges):
+                for future in merging: future.result()
+                yield fill_shared_sample(group)
+            return
+        with concurrent.futures.ProcessPoolExecutor(config['workers']) as executor:
+            futures = []
+            for group, merging in zip(groups, merges):
+                for future in merging: future.result()
+                futures.append(executor.submit(fill_shared_sample, group))
+            for future in futures:
+                yield future.result()
+
+# Fill all samples of a config in configuration order.
+def fill_samples(config):
+
+    samples = [sample for category in config['categories'] for sample in category['samples']]
+    for results in fill_groups(config, [[(config, sample)] for sample in samples]):
+        yield results[0]
+
+# Attributes of a histogram that affect filling. Styling attributes are left out.
+def get_fill_key(hist):
+
+    return (cache.normalize_expression(hist['expr']), hist['nbin'], hist['lb'], hist['ub'],
+            hist['binning'], hist['bins'], tuple(hist['window']))
+
+# Regions of a configuration as stored along the region axis of histograms.
+def get_region_keys(config):
+
+    return [(region['name'], cache.normalize_expression(region['expr'])) for region in config['regions']]
+
+# Weight variations of a configuration as stored along the variation axis of histograms, nominal first.
+def get_variation_keys(config):
+
+    return ['nominal'] + [(variation['name'], cache.normalize_expression(variation['expr'])) for variation in config['weight-variations']]
+
+# Leading axes of stored histograms: regions if declared, then weight variations if declared.
+def get_axes(config):
+
+    return ((len(config['regions']),) if config['regions'] else ()) + \
+           ((1 + len(config['weight-variations']),) if config['weight-variations'] else ())
+
+# Attributes of a hist or cube axis that determine its bins.
+def get_axis_key(item):
+
+    return (cache.normalize_expression(item['expr']), item['nbin'], item['lb'], item['ub'], item['binning'], item['bins'])
+
+# Hists of a config served as projections of its cube, as {hist index: (axis index, slot ranges of other axes)}.
+# A hist is served when an axis has its expression and bins, and every window before it is expressed by slot
+# ranges of an axis with the expression of its hist (see cube.get_slot_range). Other hists fall back to filling
+# from events.
+def get_cube_projections(config):
+
+    if config['cube'] is None: return {}
+    axes = config['cube']['axes']
+    keys = [get_axis_key(axis) for axis in axes]
+    projections, ranges = {}, {}
+    for i, hist in enumerate(config['hists']):
+        if get_axis_key(hist) in keys:
+            projections[i] = (keys.index(get_axis_key(hist)), dict(ranges))
+        for j, axis in enumerate(axes):
+            if keys[j][0] != cache.normalize_expression(hist['expr']): continue
+            window = cube.get_slot_range(fill.get_bins(axis), hist['window'])
+            if window is None: continue
+            begin, end = ranges.get(j, window)
+            ranges[j] = (max(begin, window[0]), min(end, window[1]))
+            break
+        else:
+            break
+    return projections
+
+# Fill stage: read samples and produce a histogram store with per-category lines and cutflow numbers.
+# Results of the samples in configuration order can be given by the caller instead.
+def fill_store(config, results=None):
 
     # An expression produces values to fill a histogram.
-    if not config['hists']: return
     expressions = [hist['expr'] for hist in config['hists']]
+    print('Expression plan: %s' % expr.Plan([config['weight'], *[expr.substitute(variation['expr'], 'weight', config['weight'])
+                                                                for variation in config['weight-variations']],
+                                              *[region['expr'] for region in config['regions']], *expressions]))
+    projections = get_cube_projections(config)
+    if config['cube'] is not None:
+        print('Cube: %d axes, %d/%d hists projected from it' % (len(config['cube']['axes']), len(projections), len(config['hists'])))
+    if results is None: results = fill_samples(config)
     lines_all_categories = [[] for hist in config['hists']]
+    categories = []
+    axes = get_axes(config)
 
-    # Draw a group of histograms for each category.
-    nsg, nbg, wsg, wbg, wsg_before, wbg_before = 0, 0, 0.0, 0.0, 0.0, 0.0
+    # Fill a group of histograms for each category.
     for category in config['categories']:
-        lines = [list(np.histogram([], bins=hist['nbin'], range=(hist['lb'], hist['ub']), weights=[]))
-                 for hist in config['hists']]  # 0: counts, 1: bins
-        windows = [hist['window'] for hist in config['hists']]
+        lines = [[np.zeros(axes + (hist['nbin'],)), fill.get_bins(hist), np.zeros(axes + (hist['nbin'],))]
+                 for hist in config['hists']]  # 0: counts, 1: bins, 2: sumw2, with leading region and variation axes
         name = category['name']
         xs = 0.0
         nevent = 0
         nvalid_sum = 0
         weight_sum = 0.0
         weight_sum_before = 0.0
+        patterns = {}
+        region_patterns = [{} for region in config['regions']]
+        category_cube = None
 
         # Sum up all samples.
         for sample in category['samples']:
-            print('Processing: %s' % sample['name'])
             xs += sample['xs']
             nevent += sample['nevent']
-            weight = sample['weight']
-            files = sample.get('merged-file')
-            if files:
-                files = [files]
-            else:
-                files = sample['files']
-            if not files: continue
-            files = [file + ':Events' for file in files]
-
-            # Evaluate expressions.
-            try:
-                values = uproot.concatenate(files, [weight, *expressions], library='np', how=tuple, allow_missing=True)
-                nevent = len(values[0])
-                values = [value[:sample['maxevent']] for value in values]
-                weight, values = values[0], values[1:]
-            except Exception as e:
-                for file in files:
-                    try: uproot.open(file).close(); raise e
-                    except Exception: pass
-                continue
-            weight *= sample['xs'] * 1e3 * config['luminosity'] * (nevent / sample['nevent']) / np.sum(weight)  # [XXX] suppression ratio
-
-            # Fill histograms. Use zero weights as masks.
-            weight_sum_before += np.sum(weight)
-            for hist, line, value, window in zip(config['hists'], lines, values, windows):
-                line[0] += np.histogram(value, bins=line[1], weights=weight)[0]
-                nvalid = np.sum(weight.astype('bool').astype('int'))
-                print('%s: %d/%d events in %s' % (sample['name'], nvalid, weight.shape[0], hist['name']))
-                weight *= np.logical_and(window[0] <= value, value <= window[1])
-            nvalid = np.sum(weight.astype('bool').astype('int'))
-            print('%s: %d/%d events in the end' % (sample['name'], nvalid, weight.shape[0]))
-            nvalid_sum += nvalid
-            weight_sum += np.sum(weight)
+            result = next(results)
+            if result is None: continue
+
+            # Normalize to the luminosity.
+            scale = sample['xs'] * 1e3 * config['luminosity'] * (result['nevent'] / sample['nevent']) / (result['weight-sum-before'] or 1.0)  # [XXX] suppression ratio
+            for line, count, sumw2 in zip(lines, result['counts'], result['sumw2']):
+                line[0] += count * scale
+                line[2] += sumw2 * scale**2
+            nvalid_sum += result['nvalid']
+            weight_sum += result['weight-sum'] * scale
+            weight_sum_before += result['weight-sum-before'] * scale
+            cutflow.add_patterns(patterns, result['cutflow'], scale)
+            for total, region_result in zip(region_patterns, result['region-cutflows']):
+                cutflow.add_patterns(total, region_result, scale)
+            if result.get('cube') is not None:
+                if category_cube is None:
+                    category_cube = cube.Cube(config['cube']['axes'], result['cube'].nweight, cache.parse_size(config['cube']['memory']))
+                category_cube.add(result['cube'], scale)
 
         # Store histograms.
         for line_all_categories, line in zip(lines_all_categories, lines):
             line_all_categories.append((name, line))
+        if category_cube is not None: print('Cube for %s: %s' % (name, category_cube))
         print('Summary for %s: %d/%d events scaled to %f pb\n' % (name, nvalid_sum, nevent, xs))
-        if name in config['signal-categories']:
-            nsg += nvalid_sum
-            wsg += weight_sum
-            wsg_before += weight_sum_before
+        categories.append({'name': name, 'xs': xs, 'nevent': nevent, 'nvalid': nvalid_sum,
+                           'weight-sum': weight_sum, 'weight-sum-before': weight_sum_before, 'cutflow': patterns,
+                           'region-cutflows': region_patterns, 'cube': category_cube})
+    return {'hists': [get_fill_key(hist) for hist in config['hists']], 'regions': get_region_keys(config),
+            'variations': get_variation_keys(config) if config['weight-variations'] else [],
+            'cube': [get_axis_key(axis) for axis in config['cube']['axes']] if config['cube'] is not None else None,
+            'lines': lines_all_categories, 'categories': categories}
+
+# Save a histogram store.
+def save_store(store, path):
+
+    with open(path, 'wb') as file:
+        pickle.dump(store, file)
+
+# Load a histogram store.
+def load_store(path):
+
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+# Print the signal and background summary of a histogram store.
+def summarize(config, store):
+
+    nsg, nbg, wsg, wbg, wsg_before, wbg_before = 0, 0, 0.0, 0.0, 0.0, 0.0
+    for entry in store['categories']:
+        if entry['name'] in config['signal-categories']:
+            nsg += entry['nvalid']
+            wsg += entry['weight-sum']
+            wsg_before += entry['weight-sum-before']
         else:
-            nbg += nvalid_sum
-            wbg += weight_sum
-            wbg_before += weight_sum_before
+            nbg += entry['nvalid']
+            wbg += entry['weight-sum']
+            wbg_before += entry['weight-sum-before']
     sig = get_significance(wsg, wbg)
     print('Summary: nsg=%d nbg=%d wsg=%f(%f) wbg=%f(%f) sig=%f' % (nsg, nbg, wsg, wsg / (wsg_before + (wsg == 0)), wbg, wbg / (wbg_before + (wbg == 0)), sig))
 
+# Export the cutflow table of each category, followed by those of each category within each region.
+def export_cutflow(config, store):
+
+    cutflows = [(entry['name'], entry['cutflow']) for entry in store['categories']]
+    for i, region in enumerate(config['regions']):
+        cutflows += [('%s/%s' % (entry['name'], region['name']), entry['region-cutflows'][i]) for entry in store['categories']]
+    cutflow.export(config['cutflow'], config['hists'], cutflows)
+
+# Render stage: draw every plot from a histogram store without touching ROOT files.
+# With regions, each hist is drawn once per region. Only nominal weights are drawn.
+def render(config, store=None):
+
+    if store is None: store = load_store(config['store'])
+    if store['hists'] != [get_fill_key(hist) for hist in config['hists']] or store.get('regions', []) != get_region_keys(config) \
+            or store.get('variations', []) != (get_variation_keys(config) if config['weight-variations'] else []):
+        raise ValueError('histogram store %s does not match the configuration, rerun the fill stage' % config['store'])
+    lines_all_categories = store['lines']
+    nominal = (0,) if config['weight-variations'] else ()
+
     # Draw and export histograms.
     for hist, line_all_categories in zip(config['hists'], lines_all_categories):
         if not line_all_categories: continue
         bins = line_all_categories[0][1][1]
         names = [h[0] for h in line_all_categories]
-        counts = [h[1][0] for h in line_all_categories]
-        sg_names, bg_names, sg_counts, bg_counts = [], [], [], []
-        for name, count in zip(names, counts):
-            if name in config['signal-categories']:
-                sg_names.append(name); sg_counts.append(count)
-            else:
-                bg_names.append(name); bg_counts.append(count)
-        sg_names, sg_counts = sort_names_and_counts(sg_names, sg_counts)
-        bg_names, bg_counts = sort_names_and_counts(bg_names, bg_counts)
-        fig = plt.figure(figsize=hist['figsize'], dpi=hist['dpi'])
-        gs = gridspec.GridSpec(hist['nsubplot-y'], hist['nsubplot-x'],
-                               wspace=hist['subplot-space-x'], hspace=hist['subplot-space-y'],
-                               width_ratios=hist['subplot-ratios-x'], height_ratios=hist['subplot-ratios-y'])
-        gsi = 0
+        if not config['regions']:
+            render_hist(config, hist, bins, names, [h[1][0][nominal] for h in line_all_categories], hist['name'])
+        for i, region in enumerate(config['regions']):
+            render_hist(config, hist, bins, names, [h[1][0][(i,) + nominal] for h in line_all_categories],
+                        '%s-%s' % (hist['name'], region['name']))
+
+# Draw one histogram of all categories and export it to files named after prefix.
+def render_hist(config, hist, bins, names, counts, prefix):
+
+    sg_names, bg_names, sg_counts, bg_counts = [], [], [], []
+    for name, count in zip(names, counts):
+        if name in config['signal-categories']:
+            sg_names.append(name); sg_counts.append(count)
+        else:
+            bg_names.append(name); bg_counts.append(count)
+    sg_names, sg_counts = sort_names_and_counts(sg_names, sg_counts)
+    bg_names, bg_counts = sort_names_and_counts(bg_names, bg_counts)
+    fig = plt.figure(figsize=hist['figsize'], dpi=hist['dpi'])
+    gs = gridspec.GridSpec(hist['nsubplot-y'], hist['nsubplot-x'],
+                           wspace=hist['subplot-space-x'], hspace=hist['subplot-space-y'],
+                           width_ratios=hist['subplot-ratios-x'], height_ratios=hist['subplot-ratios-y'])
+    gsi = 0
+    fig.add_subplot(gs[gsi])
+    gsi += 1
+    try:
+        hep.cms.label(data=not config['mc'], paper=not hist['preliminary'], supplementary=hist['supplementary'],
+                      year=config['year'], lumi=config['luminosity'])
+    except Exception:
+        label = 'Preliminary' if hist['preliminary'] else 'Supplementary' if hist['supplementary'] else ''
+        hep.cms.label(data=not config['mc'], label=label, year=config['year'], lumi=config['luminosity'])
+    if hist['stack'] and hist['no-stack-signal']:
+        hep.histplot(bg_counts, bins, label=bg_names, stack=True, histtype='fill', edgecolor='black', linewidth=0.5)
+        hep.histplot(sg_counts, bins, label=sg_names)
+    else:
+        bs_counts = bg_counts + sg_counts
+        bs_names = bg_names + sg_names
+        if hist['stack']:
+            hep.histplot(bs_counts, bins, label=bs_names, stack=True, histtype='fill', edgecolor='black', linewidth=0.5)
+        else:
+            hep.histplot(bs_counts, bins, label=bs_names)
+    plt.xlabel(hist['xlabel'])
+    plt.ylabel(hist['ylabel'])
+    plt.xscale(hist['xscale'])
+    plt.yscale(hist['yscale'])
+    if hist['grid']: plt.grid(axis=hist['grid'])
+    plt.legend(**hist['legend-options'])
+    plt.tight_layout()
+
+    # Draw significance subplots.
+    if hist['subplot-significance-lower'] or hist['subplot-significance-upper']:
+        plt.xlabel('')
+        plt.gca().set_xticklabels([])
         fig.add_subplot(gs[gsi])
         gsi += 1
-        try:
-            hep.cms.label(data=not config['mc'], paper=not hist['preliminary'], supplementary=hist['supplementary'],
-                          year=config['year'], lumi=config['luminosity'])
-        except Exception:
-            label = 'Preliminary' if hist['preliminary'] else 'Supplementary' if hist['supplementary'] else ''
-            hep.cms.label(data=not config['mc'], label=label, year=config['year'], lumi=config['luminosity'])
-        if hist['stack'] and hist['no-stack-signal']:
-            hep.histplot(bg_counts, bins, label=bg_names, stack=True, histtype='fill', edgecolor='black', linewidth=0.5)
-            hep.histplot(sg_counts, bins, label=sg_names)
-        else:
-            bs_counts = bg_counts + sg_counts
-            bs_names = bg_names + sg_names
-            if hist['stack']:
-                hep.histplot(bs_counts, bins, label=bs_names, stack=True, histtype='fill', edgecolor='black', linewidth=0.5)
-            else:
-                hep.histplot(bs_counts, bins, label=bs_names)
+        if hist['subplot-significance-lower']:
+            csg = np.sum(sg_counts, axis=0)
+            cbg = np.sum(bg_counts, axis=0)
+            csg = np.concatenate([np.cumsum(csg[::-1])[::-1], [0.0]])
+            cbg = np.concatenate([np.cumsum(cbg[::-1])[::-1], [0.0]])
+            sig = get_significance(csg, cbg)
+            plt.plot(bins, sig, '*-k')
+        if hist['subplot-significance-upper']:
+            csg = np.sum(sg_counts, axis=0)
+            cbg = np.sum(bg_counts, axis=0)
+            csg = np.concatenate([[0.0], np.cumsum(csg)])
+            cbg = np.concatenate([[0.0], np.cumsum(cbg)])
+            sig = get_significance(csg, cbg)
+            plt.plot(bins, sig, '^-k')
         plt.xlabel(hist['xlabel'])
-        plt.ylabel(hist['ylabel'])
+        plt.ylabel('significance')
         plt.xscale(hist['xscale'])
-        plt.yscale(hist['yscale'])
         if hist['grid']: plt.grid(axis=hist['grid'])
-        plt.legend(**hist['legend-options'])
         plt.tight_layout()
 
-        # Draw significance subplots.
-        if hist['subplot-significance-lower'] or hist['subplot-significance-upper']:
-            plt.xlabel('')
-            plt.gca().set_xticklabels([])
-            fig.add_subplot(gs[gsi])
-            gsi += 1
-            if hist['subplot-significance-lower']:
-                csg = np.sum(sg_counts, axis=0)
-                cbg = np.sum(bg_counts, axis=0)
-                csg = np.concatenate([np.cumsum(csg[::-1])[::-1], [0.0]])
-                cbg = np.concatenate([np.cumsum(cbg[::-1])[::-1], [0.0]])
-                sig = get_significance(csg, cbg)
-                plt.plot(bins, sig, '*-k')
-            if hist['subplot-significance-upper']:
-                csg = np.sum(sg_counts, axis=0)
-                cbg = np.sum(bg_counts, axis=0)
-                csg = np.concatenate([[0.0], np.cumsum(csg)])
-                cbg = np.concatenate([[0.0], np.cumsum(cbg)])
-                sig = get_significance(csg, cbg)
-                plt.plot(bins, sig, '^-k')
-            plt.xlabel(hist['xlabel'])
-            plt.ylabel('significance')
-            plt.xscale(hist['xscale'])
-            if hist['grid']: plt.grid(axis=hist['grid'])
-            plt.tight_layout()
-
-        # Export the plots.
-        for extension in hist['format']:
-            plt.savefig('%s-%s-%s-%s-%s.%s' % (
-                hist['name'], hist['xscale'], hist['yscale'],
-                'stack' if hist['stack'] else 'step',
-                'stack' if hist['stack'] and not hist['no-stack-signal'] else 'step',
-                extension
-            ))
-        plt.close()
+    # Export the plots.
+    for extension in hist['format']:
+        plt.savefig('%s-%s-%s-%s-%s.%s' % (
+            prefix, hist['xscale'], hist['yscale'],
+            'stack' if hist['stack'] else 'step',
+            'stack' if hist['stack'] and not hist['no-stack-signal'] else 'step',
+            extension
+        ))
+    plt.close()
+
+def run(config):
+
+    if not config['hists']: return
+    store = fill_store(config)
+    save_store(store, config['store'])
+    summarize(config, store)
+    export_cutflow(config, store)
+    render(config, store)
 
 if __name__ == '__main__':
 
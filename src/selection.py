@@ -0,0 +1,58 @@
+import numpy as np
+import awkward as ak
+
+class Selection:
+
+    # Events selected from record arrays read one after another, seen as one base array. The cut state is an
+    # ascending index into the base, so cuts compose by indexing the index. Fields are converted from the base
+    # once, on first use, and shared by all selections derived from it; each selection gathers a field at its
+    # index once, when asked for it.
+    def __init__(self, events, index=None, columns=None):
+
+        self.events = events if isinstance(events, list) else [events]
+        self.offsets = np.cumsum([0] + [len(part) for part in self.events])
+        self.index = np.arange(self.offsets[-1]) if index is None else index
+        self.columns = {} if columns is None else columns
+        self.gathered = {}
+
+    def __len__(self):
+
+        return len(self.index)
+
+    # A field of the whole base array as a flat numpy array.
+    def get_column(self, name):
+
+        if name not in self.columns:
+            parts = [ak.to_numpy(part[name]) for part in self.events]
+            self.columns[name] = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return self.columns[name]
+
+    # A field of the selected events.
+    def __getitem__(self, name):
+
+        if name not in self.gathered:
+            self.gathered[name] = self.get_column(name)[self.index]
+        return self.gathered[name]
+
+    # Keep selected events passing a boolean mask over them.
+    def cut(self, mask):
+
+        return Selection(self.events, self.index[np.asarray(mask, dtype=bool)], self.columns)
+
+    # Split selected events into those passing a boolean mask over them and the rest.
+    def split(self, mask):
+
+        mask = np.asarray(mask, dtype=bool)
+        return Selection(self.events, self.index[mask], self.columns), Selection(self.events, self.index[~mask], self.columns)
+
+    # Keep selected events of the i-th record array of the base.
+    def part(self, i):
+
+        begin, end = np.searchsorted(self.index, self.offsets[i:i + 2])
+        return Selection(self.events, self.index[begin:end], self.columns)
+
+    # Events selected by any of several selections over the same base.
+    @staticmethod
+    def union(selections):
+
+        return Selection(selections[0].events, np.unique(np.concatenate([s.index for s in selections])), selections[0].columns)
@@ -0,0 +1,130 @@
+import numpy as np
+
+WINDOW_BLOCK_SIZE = 1 << 20  # Windows evaluated at once, which bounds memory on fine binnings.
+
+def get_significance(s, b):
+
+    return np.sqrt(2 * ((s + b) * np.log(1 + s / (b + (s == 0))) - s))
+
+# Scan the significance of every window [bins[imin], bins[imax]], imin < imax, of signal and background
+# counts per bin. Window sums are differences of cumulative sums, broadcast over blocks of lower edges.
+# Windows with less background than min_background score zero. Return the best significance of windows
+# starting at each edge and of windows ending at each edge, both of length nbin + 1.
+def scan_windows(s_counts, b_counts, min_background=None):
+
+    s_cumsum = np.concatenate([[0.0], np.cumsum(s_counts, dtype='float64')])
+    b_cumsum = np.concatenate([[0.0], np.cumsum(b_counts, dtype='float64')])
+    nedge = len(s_cumsum)
+    signif_l = np.zeros(nedge)
+    signif_u = np.zeros(nedge)
+    block_size = max(1, WINDOW_BLOCK_SIZE // nedge)
+    for begin in range(0, nedge - 1, block_size):
+        imin = np.arange(begin, min(begin + block_size, nedge - 1))[:, np.newaxis]
+        s = s_cumsum[np.newaxis, :] - s_cumsum[imin]
+        b = b_cumsum[np.newaxis, :] - b_cumsum[imin]
+        valid = np.arange(nedge)[np.newaxis, :] > imin
+        if min_background is not None: valid &= b >= min_background
+        with np.errstate(divide='ignore', invalid='ignore'):
+            signif = np.where(valid, get_significance(s, b), 0.0)
+        signif_l[imin[:, 0]] = signif.max(axis=1)
+        signif_u = np.maximum(signif_u, signif.max(axis=0))
+    return signif_l, signif_u
+
+# Score edges of a threshold scan: a uniform grid of nbin bins on [lb, ub] merged with the given thresholds,
+# and open ends, so that each of them is an exact cut.
+def get_score_edges(nbin, lb=0.0, ub=1.0, thresholds=()):
+
+    return np.unique(np.concatenate([[-np.inf], np.linspace(lb, ub, nbin + 1), np.hstack([[], *thresholds]), [np.inf]]))
+
+# Histogram values of a variable against scores. Row k holds events with edges[k] <= score < edges[k + 1].
+def fill_scores(score, value, bins, edges, weight=None):
+
+    weight = None if weight is None else np.asarray(weight, dtype='float64')
+    return np.histogram2d(np.asarray(score, dtype='float64'), np.asarray(value, dtype='float64'), [edges, bins], weights=weight)[0]
+
+# Cumulative sums of a score histogram along the score axis. Row k sums events with score < edges[k].
+def cumulate_scores(counts):
+
+    counts = np.asarray(counts, dtype='float64')
+    return np.concatenate([np.zeros((1,) + counts.shape[1:]), np.cumsum(counts, axis=0)])
+
+# Select events with lb <= score < ub from the cumulative sums of a score histogram. Both bounds must be
+# score edges. Nothing is selected if lb >= ub.
+def select_scores(cumsum, edges, lb=-np.inf, ub=np.inf):
+
+    index = np.searchsorted(edges, [lb, ub])
+    if np.any(edges[np.minimum(index, len(edges) - 1)] != [lb, ub]): raise ValueError('score cuts must fall on score edges')
+    return cumsum[index[1]] - cumsum[min(index)]
+
+# Best significance over all mass windows of each row of signal and background counts shaped (n, nbin), and
+# the bins [imin, imax) of the best windows shaped (n, 2). Windows without background are skipped, as their
+# significance is unbounded, and so are windows with less background than min_background.
+def get_best_windows(s_counts, b_counts, min_background=None):
+
+    s_cumsum = np.cumsum(np.pad(np.asarray(s_counts, dtype='float64'), [(0, 0), (1, 0)]), axis=1)
+    b_cumsum = np.cumsum(np.pad(np.asarray(b_counts, dtype='float64'), [(0, 0), (1, 0)]), axis=1)
+    imin, imax = np.triu_indices(s_cumsum.shape[1], 1)
+    best, windows = np.zeros(len(s_cumsum)), np.zeros((len(s_cumsum), 2), dtype=int)
+    block_size = max(1, WINDOW_BLOCK_SIZE // len(imin))
+    for begin in range(0, len(best), block_size):
+        rows = slice(begin, begin + block_size)
+        s = s_cumsum[rows, imax] - s_cumsum[rows, imin]
+        b = b_cumsum[rows, imax] - b_cumsum[rows, imin]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            signif = get_significance(s, b)
+        signif[~(b > 0.0) | (b < (min_background or 0.0))] = 0.0
+        arg = signif.argmax(axis=1)
+        best[rows] = signif[np.arange(len(arg)), arg]
+        windows[rows] = np.stack([imin[arg], imax[arg]], axis=1)
+    return best, windows
+
+# Choose one threshold per region from its candidates, regions ordered from the highest scores down, so that
+# region r holds events with thresholds[r] <= score < thresholds[r - 1]. The combined significance, the quadratic
+# sum of the best-window significances of the regions, is maximized exactly over all threshold tuples by dynamic
+# programming over consecutive regions, evaluated at once for all (threshold, threshold above) pairs. Cumulative
+# score histograms are shaped (nedge, nbin) and candidates must be score edges. Every mass window is scanned for
+# each pair unless windows fixes the bins [imin, imax) of a region, which makes thousands of candidates per region
+# cheap. Return the combined significance, and the threshold, significance and mass window of each region.
+def optimize_thresholds(s_cumsum, b_cumsum, edges, candidates, min_background=None, windows=None):
+
+    windows = windows or [None] * len(candidates)
+    upper = np.array([len(edges) - 1])  # the open upper end
+    total = np.zeros(1)
+    steps = []
+    for thresholds, window in zip(candidates, windows):
+        lower = np.searchsorted(edges, thresholds)
+        if np.any(edges[np.minimum(lower, len(edges) - 1)] != thresholds): raise ValueError('thresholds must fall on score edges')
+        s_region, b_region = s_cumsum, b_cumsum
+        if window is not None:
+            s_region, b_region = [cumsum[:, window[0]:window[1]].sum(axis=1, keepdims=True) for cumsum in [s_cumsum, b_cumsum]]
+        nbin = s_region.shape[1]
+        choice, z2, best = np.zeros(len(lower), dtype=int), np.zeros(len(lower)), np.zeros(len(lower))
+        region_windows = np.zeros((len(lower), 2), dtype=int)
+        block_size = max(1, WINDOW_BLOCK_SIZE // (len(upper) * nbin * (nbin + 1) // 2))
+        for begin in range(0, len(lower), block_size):
+            rows, block = lower[begin:begin + block_size], slice(begin, begin + block_size)
+            s = (s_region[upper][np.newaxis] - s_region[rows][:, np.newaxis]).reshape(-1, nbin)
+            b = (b_region[upper][np.newaxis] - b_region[rows][:, np.newaxis]).reshape(-1, nbin)
+            pair_z, pair_windows = get_best_windows(s, b, min_background)
+            pair_z2 = pair_z.reshape(len(rows), len(upper))**2
+            pair_total = np.where(rows[:, np.newaxis] < upper[np.newaxis, :], pair_z2 + total[np.newaxis, :], -np.inf)
+            choice[block] = pair_total.argmax(axis=1)
+            z2[block] = pair_z2[np.arange(len(rows)), choice[block]]
+            best[block] = pair_total[np.arange(len(rows)), choice[block]]
+            region_windows[block] = pair_windows.reshape(len(rows), len(upper), 2)[np.arange(len(rows)), choice[block]]
+        if window is not None: region_windows[:] = window
+        total = best
+        steps.append((lower, choice, z2, region_windows))
+        upper = lower
+    if np.all(total == -np.inf): raise ValueError('no ordered threshold tuple among the candidates')
+
+    # Trace the best tuple back from the lowest region.
+    i = int(total.argmax())
+    signif = np.sqrt(total[i])
+    thresholds, signifs, best_windows = [], [], []
+    for lower, choice, z2, region_windows in reversed(steps):
+        thresholds.append(float(edges[lower[i]]))
+        signifs.append(float(np.sqrt(z2[i])))
+        best_windows.append(tuple(int(j) for j in region_windows[i]))
+        i = choice[i]
+    return float(signif), thresholds[::-1], signifs[::-1], best_windows[::-1]
@@ -0,0 +1,30 @@
+import os
+import sys
+
+basedir = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(basedir, 'src'))
+import numpy as np
+import cube
+
+# A decimal window bound matches the rounded edge of linearly spaced bins, 0.30000000000000004 for 0.3.
+def test_slot_range_of_decimal_window():
+
+    bins = np.histogram_bin_edges([], bins=10, range=(0.0, 1.0))
+    assert bins[3] != 0.3
+    assert cube.get_slot_range(bins, [0.3, 1.0]) == (4, 11)
+    assert cube.get_slot_range(bins, [0.3, np.inf]) == (4, 12)
+    assert cube.get_slot_range(bins, [0.35, 1.0]) is None
+    assert cube.get_slot_range(bins, [0.3, 0.7]) is None
+
+# A projection behind a decimal window selects the same events as the window.
+def test_projection_of_decimal_window():
+
+    rng = np.random.default_rng(1)
+    x, y, weight = rng.uniform(-0.2, 1.2, 10000), rng.uniform(0.0, 100.0, 10000), rng.uniform(0.5, 1.5, 10000)
+    axes = [{'nbin': 10, 'lb': 0.0, 'ub': 1.0}, {'nbin': 20, 'lb': 0.0, 'ub': 100.0}]
+    filled = cube.Cube(axes)
+    filled.fill([x, y], weight[np.newaxis, :])
+    counts, sumw2 = filled.project(1, {0: cube.get_slot_range(filled.bins[0], [0.3, 1.0])})
+    passed = (0.3 <= x) & (x <= 1.0)
+    assert np.allclose(counts[0], np.histogram(y[passed], filled.bins[1], weights=weight[passed])[0])
+    assert np.allclose(sumw2[0], np.histogram(y[passed], filled.bins[1], weights=weight[passed]**2)[0])
@@ -0,0 +1,22 @@
+import os
+import sys
+
+basedir = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(basedir, 'src'))
+import pickle
+import awkward as ak
+import uproot
+import expr
+
+# Subscripts are lowered into the plan, and other syntax uproot accepts falls back to Python, with values
+# identical to uproot's.
+def test_plan_matches_uproot():
+
+    expressions = ['ak15_sdmass[:10]', '(ak15_sdmass * 2)[::2]', 'PSWeight[:, 0] * ak15_sdmass', "{'a': ak15_sdmass}['a'] + 1"]
+    with uproot.open(os.path.join(basedir, 'example', 'EXO-RunIISummer20UL18MiniAODv2-01346-1_0_tree.root')) as file:
+        tree = file['Events']
+        plan = pickle.loads(pickle.dumps(expr.Plan(expressions)))
+        assert plan.branches == ['PSWeight', 'ak15_sdmass']
+        values = plan.evaluate(tree.arrays(plan.branches, entry_stop=100, library='ak'))
+        for expression, value in zip(expressions, values):
+            assert ak.all(value == tree.arrays([expression], entry_stop=100, library='ak')[expression])
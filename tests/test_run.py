@@ -0,0 +1,26 @@
+import os
+import sys
+
+basedir = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(basedir, 'src'))
+from config import Config
+import run
+
+# Weight sums of the categories of the example sample, slimmed by a merge preselection into a temporary directory.
+def get_weight_sums(directory, **override):
+
+    override = dict({'sample-dir': os.path.join(basedir, 'example'), 'merged-sample-dir': str(directory),
+                     'catalog': os.path.join(str(directory), 'catalog.db'), 'merge-backend': 'uproot',
+                     'merge-preselection': 'ak15_sdmass > 50'}, **override)
+    config = Config(os.path.join(basedir, 'run', '2018', '1L', 'mc', 'zss_part', 'config.yaml'), override, cache_dir=None)
+    return [category['weight-sum'] for category in run.fill_store(config)['categories']]
+
+# A partial read of a preselected slimmed sample is normalized to the full sample like a full read. The weight
+# sum before the preselection is taken pro rata of entries, so yields agree up to fluctuations of the weights.
+def test_partial_read_of_preselected_sample(tmp_path):
+
+    full = get_weight_sums(tmp_path)
+    partial = get_weight_sums(tmp_path, maxevent=200)
+    assert full[0] > 0
+    for full_sum, partial_sum in zip(full, partial):
+        assert abs(partial_sum - full_sum) <= 0.05 * abs(full_sum)